@@ -18,7 +18,8 @@ from models import database
 from views.address import AddressesHandler, AddressHandler
 from views.auth import LoginHandler, LogoutHandler
 from views.orders import OrdersHandler, OrderHandler
-from views.items import ItemHandler, ItemsHandler, SearchItemHandler
+from views.items import (ItemHandler, ItemsHandler, SearchItemHandler,
+                         SuggestItemHandler)
 from views.user import UsersHandler, UserHandler
 from views.pictures import PictureHandler, ItemPictureHandler
 from views.favorites import FavoritesHandler, FavoriteHandler
@@ -59,6 +60,7 @@ api.add_resource(ItemsHandler, "/items/")
 api.add_resource(ItemHandler, "/items/<uuid:item_uuid>")
 api.add_resource(ItemPictureHandler, '/items/<uuid:item_uuid>/pictures/')
 api.add_resource(SearchItemHandler, "/items/db/")
+api.add_resource(SuggestItemHandler, "/items/suggest/")
 api.add_resource(OrdersHandler, '/orders/')
 api.add_resource(OrderHandler, '/orders/<uuid:order_uuid>')
 api.add_resource(UsersHandler, '/users/')
@@ -3,16 +3,18 @@ Application ORM Models built with Peewee
 """
 import datetime
 import os
+import time
+from collections import Counter
 from exceptions import (InsufficientAvailabilityException,
                         WrongQuantity, SearchAttributeMismatch)
 from uuid import uuid4
 
 from flask_login import UserMixin
 from passlib.hash import pbkdf2_sha256
-from peewee import (BooleanField, CharField, DateTimeField, DecimalField,
-                    ForeignKeyField, IntegerField, PostgresqlDatabase,
-                    TextField, UUIDField)
-from playhouse.signals import Model, post_delete, pre_delete
+from peewee import (SQL, BooleanField, CharField, DateTimeField, DecimalField,
+                    ForeignKeyField, IntegerField, TextField, UUIDField, fn, prefetch)
+from playhouse.shortcuts import case
+from playhouse.signals import Model, post_delete, post_save, pre_delete
 
 from schemas import (AddressSchema, BaseSchema, FavoriteSchema, ItemSchema,
                      OrderItemSchema, OrderSchema, PictureSchema, UserSchema)
@@ -23,18 +25,29 @@ from utils import remove_image
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'dev')
 if ENVIRONMENT != 'dev':
     import urllib.parse
+    from playhouse.postgres_ext import PostgresqlExtDatabase
     urllib.parse.uses_netloc.append('postgres')
     url = urllib.parse.urlparse(os.getenv('DATABASE_URL'))
-    database = PostgresqlDatabase(database=url.path[1:],
-                                  user=url.username,
-                                  password=url.password,
-                                  host=url.hostname,
-                                  port=url.port,
-                                  )
+    # the extension compiler is needed by the full-text `ItemDocument`
+    # (tsvector match operator and GIN index)
+    database = PostgresqlExtDatabase(database=url.path[1:],
+                                     user=url.username,
+                                     password=url.password,
+                                     host=url.hostname,
+                                     port=url.port,
+                                     register_hstore=False,
+                                     )
 
 else:
-    from peewee import SqliteDatabase
-    database = SqliteDatabase('database.db')
+    from playhouse.sqlite_ext import SqliteExtDatabase
+    database = SqliteExtDatabase('database.db')
+
+#: path of the Item search index snapshot shared by the processes of the host,
+#: see :any:`BaseModel.save_search_snapshot`. Disabled if not set.
+SEARCH_SNAPSHOT = os.getenv('SEARCH_SNAPSHOT')
+#: if set, the Item full-text documents (:any:`ItemDocument`) are written on
+#: every change and the ``use_fulltext`` search filter is available.
+SEARCH_FULLTEXT = bool(os.getenv('SEARCH_FULLTEXT'))
 
 
 class BaseModel(Model):
@@ -68,6 +81,55 @@ class BaseModel(Model):
     #: map each weight to attributes (:any:`BaseModel._search_attributes`)
     #: indexes.
     _search_weights = None
+    #: In-process :class:`search.InvertedIndex` over ``_search_attributes``,
+    #: built lazily on the first indexed search (see :any:`BaseModel.search_index`)
+    _search_index = None
+    #: table fingerprint (see :any:`BaseModel._search_fingerprint`) the search
+    #: index is up to date with
+    _search_index_fingerprint = None
+    #: ``time.monotonic()`` of the last check of the search index against the
+    #: table fingerprint
+    _search_index_checked = 0
+    #: seconds between two checks of the search index and autocomplete trie
+    #: against the table, see :any:`BaseModel.search_index`
+    _search_refresh_interval = search.config.INDEX_REFRESH_INTERVAL
+    #: :class:`search.TokenCache` of the tokenized ``_search_attributes``,
+    #: created on the first search (see :any:`BaseModel.search_token_cache`)
+    _search_token_cache = None
+    #: :class:`search.ResultCache` of the search results, created on the first
+    #: cached search (see :any:`BaseModel.search_result_cache`)
+    _search_result_cache = None
+    #: Catalog version, bumped on each change of the model rows through the
+    #: model instances, cached search results of older versions are invalid.
+    _search_version = 0
+    #: Model storing the full-text documents of the callee model, used by
+    #: :any:`BaseModel.search` to filter the rows inside the database. It must
+    #: implement a ``candidates(query, limit)`` classmethod returning a query
+    #: that selects the ids of the matching rows. ``Item`` sets it only if
+    #: :any:`SEARCH_FULLTEXT` is enabled.
+    _search_document = None
+    #: max number of keys bound in a single ``IN`` clause when loading the
+    #: candidates found through the search index.
+    _search_chunk_size = 500
+    #: Path of the search index snapshot loaded by :any:`BaseModel.search_index`
+    #: in place of building the index from the table, if up to date.
+    _search_snapshot = None
+    #: Phonetic algorithm (see :class:`search.index.PhoneticIndex`) used by the
+    #: search index to find tokens that sound like the query ones, if any.
+    _search_phonetic = None
+    #: Max edit distance of the tokens found through the BK-tree of the search
+    #: index (see :class:`search.index.BKTree`), no BK-tree if None.
+    _search_edit_distance = None
+    #: Attributes whose tokens are completed by :any:`BaseModel.suggest`,
+    #: autocomplete is not available if None.
+    _suggest_attributes = None
+    #: :class:`search.CompletionTrie` over ``_suggest_attributes``, built
+    #: lazily on the first suggestion (see :any:`BaseModel.suggest_trie`)
+    _suggest_trie = None
+    #: table fingerprint the autocomplete trie is up to date with
+    _suggest_trie_fingerprint = None
+    #: ``time.monotonic()`` of the last check of the autocomplete trie
+    _suggest_trie_checked = 0
 
     def save(self, *args, **kwargs):
         """
@@ -128,10 +190,375 @@ class BaseModel(Model):
         """
         return cls._schema.validate_input(data, partial=partial)
 
+    @classmethod
+    def search_index(cls):
+        """
+        Return the :class:`search.InvertedIndex` of the callee class. If it
+        does not exist yet it is opened from the ``_search_snapshot`` file and
+        refreshed with the changes made since it was saved, or built from the
+        whole table if there is no usable snapshot.
+
+        The index is kept by each process and updated by the model signals, so
+        at most every ``_search_refresh_interval`` seconds it is compared with
+        the table fingerprint and refreshed with the changes made by other
+        processes or by bulk queries (see
+        :any:`BaseModel._refresh_search_structure`).
+
+        Returns:
+            search.InvertedIndex: index over the model ``_search_attributes``
+        """
+        if cls._search_index is None:
+            index = cls._load_search_snapshot()
+            if index is None:
+                return cls.rebuild_search_index()
+            cls._search_index = index
+            cls._search_index_fingerprint = cls._refresh_search_structure(
+                index, index.meta['fingerprint'])
+            cls._search_index_checked = time.monotonic()
+
+        if time.monotonic() - cls._search_index_checked >= cls._search_refresh_interval:
+            cls._search_index_fingerprint = cls._refresh_search_structure(
+                cls._search_index, cls._search_index_fingerprint)
+            cls._search_index_checked = time.monotonic()
+        return cls._search_index
+
+    @classmethod
+    def _search_fingerprint(cls):
+        """
+        Number of rows and last ``updated_at`` of the table, that change on
+        each row created, updated or deleted through the model instances.
+        """
+        count, updated_at = cls.select(
+            fn.COUNT(cls.id), fn.MAX(cls.updated_at)).tuples().get()
+        return [count, str(updated_at)]
+
+    @classmethod
+    def _refresh_search_structure(cls, structure, fingerprint):
+        """
+        Bring a search structure (index or autocomplete trie) that was up to
+        date with the table ``fingerprint`` up to date with the table: the
+        rows updated since then are added again to it and, if the number of
+        rows still differs, the ids of the table are diffed with the ones of
+        the structure to remove the deleted rows and add the missing ones.
+
+        Rows changed by bulk queries are found only if their ``updated_at``
+        is set as well.
+
+        Returns:
+            list: the current fingerprint of the table.
+        """
+        current = cls._search_fingerprint()
+        if current == fingerprint:
+            return current
+
+        if current[1] != fingerprint[1]:
+            rows = cls.select()
+            if fingerprint[1] != str(None):
+                # rows as recent as the last fingerprint were already added
+                rows = rows.where(cls.updated_at > fingerprint[1])
+            for obj in rows:
+                structure.add(obj)
+
+        if len(structure) != current[0]:
+            ids = {key for key, in cls.select(cls.id).tuples()}
+            known = set(structure.documents)
+            for key in known - ids:
+                structure.remove(key)
+            missing = sorted(ids - known)
+            size = cls._search_chunk_size
+            for i in range(0, len(missing), size):
+                for obj in cls.select().where(cls.id << missing[i:i + size]):
+                    structure.add(obj)
+        return current
+
+    @classmethod
+    def _load_search_snapshot(cls):
+        """
+        Open the search index snapshot of the callee class, returns None if
+        there is none or it indexes different attributes or settings. The
+        snapshot may be older than the table: see its ``fingerprint`` meta.
+        """
+        path = cls._search_snapshot
+        if not path or not os.path.exists(path):
+            return None
+
+        try:
+            index = search.snapshot.load(path)
+        except ValueError:
+            return None
+        if (index.attributes != list(cls._search_attributes) or
+                index.phonetic_algorithm != cls._search_phonetic or
+                index.edit_distance != cls._search_edit_distance or
+                'fingerprint' not in index.meta):
+            return None
+        return index
+
+    @classmethod
+    def save_search_snapshot(cls, path=None):
+        """
+        Build the search index from the table and save it as snapshot (see
+        :mod:`search.snapshot`), that processes open in place of building the
+        index again as long as the table does not change.
+
+        Arguments:
+            path (str): destination file, defaults to ``_search_snapshot``
+
+        Returns:
+            search.InvertedIndex: the saved index
+        """
+        path = path or cls._search_snapshot
+        fingerprint = cls._search_fingerprint()
+        index = search.InvertedIndex(
+            cls._search_attributes, phonetic=cls._search_phonetic,
+            edit_distance=cls._search_edit_distance)
+        index.build(cls.select())
+        search.snapshot.save(index, path, {'fingerprint': fingerprint})
+        return index
+
+    @classmethod
+    def rebuild_search_index(cls):
+        """
+        Build the search index from scratch loading all the rows of the table,
+        replacing the current one (if any).
+
+        Returns:
+            search.InvertedIndex: the new index
+        """
+        fingerprint = cls._search_fingerprint()
+        index = search.InvertedIndex(
+            cls._search_attributes, phonetic=cls._search_phonetic,
+            edit_distance=cls._search_edit_distance)
+        cls._search_index = index.build(cls.select())
+        cls._search_index_fingerprint = fingerprint
+        cls._search_index_checked = time.monotonic()
+        return cls._search_index
+
+    @classmethod
+    def search_token_cache(cls):
+        """
+        Return the :class:`search.TokenCache` of the callee class, creating
+        it if it does not exist yet. Its ``stats()`` method reports hits and
+        misses of the cache.
+        """
+        if cls._search_token_cache is None:
+            cls._search_token_cache = search.TokenCache()
+        return cls._search_token_cache
+
+    @classmethod
+    def search_result_cache(cls):
+        """
+        Return the :class:`search.ResultCache` of the callee class, creating
+        it if it does not exist yet.
+        """
+        if cls._search_result_cache is None:
+            cls._search_result_cache = search.ResultCache()
+        return cls._search_result_cache
+
+    @classmethod
+    def bump_search_version(cls):
+        """
+        Increase the catalog version of the callee class, invalidating the
+        results cached by :any:`BaseModel.search` so far.
+        """
+        cls._search_version += 1
+
+    @classmethod
+    def suggest_trie(cls):
+        """
+        Return the :class:`search.CompletionTrie` of the callee class, building
+        it from the whole table if it does not exist yet, or refreshing it as
+        the search index (see :any:`BaseModel.search_index`).
+        """
+        if cls._suggest_trie is None:
+            fingerprint = cls._search_fingerprint()
+            trie = search.CompletionTrie(cls._suggest_attributes)
+            cls._suggest_trie = trie.build(cls.select())
+            cls._suggest_trie_fingerprint = fingerprint
+            cls._suggest_trie_checked = time.monotonic()
+
+        if time.monotonic() - cls._suggest_trie_checked >= cls._search_refresh_interval:
+            cls._suggest_trie_fingerprint = cls._refresh_search_structure(
+                cls._suggest_trie, cls._suggest_trie_fingerprint)
+            cls._suggest_trie_checked = time.monotonic()
+        return cls._suggest_trie
+
+    @classmethod
+    def suggest(cls, prefix, limit=None):
+        """
+        Complete ``prefix`` with the most popular tokens of the
+        ``_suggest_attributes`` of the callee class starting with it.
+
+        Arguments:
+            prefix (str): beginning of the token to complete
+            limit (int): max number of suggestions, at most
+                :any:`config.SUGGEST_SIZE`
+
+        Returns:
+            list: suggested tokens, the ones in more rows first.
+
+        Raises:
+            SearchAttributeMismatch: if the model does not define
+                ``_suggest_attributes``.
+        """
+        if not cls._suggest_attributes:
+            raise SearchAttributeMismatch(
+                'Suggest attributes not defined for {}.'.format(cls.__name__))
+        return cls.suggest_trie().complete(prefix, limit)
+
+    @classmethod
+    def check_search_index(cls, index=None):
+        """
+        Compare a search index against the content of the table.
+
+        Arguments:
+            index (search.InvertedIndex): index to check, such as a snapshot
+                loaded with :func:`search.snapshot.load`. Defaults to the
+                index of the process, as it is.
+
+        Returns:
+            dict: ids of the inconsistent rows, split in ``missing`` (rows not
+            in the index), ``stale`` (indexed ids that are not in the table)
+            and ``outdated`` (rows indexed with different tokens).
+            All the sets are empty if the index is consistent.
+        """
+        if index is None:
+            index = cls._search_index
+        if index is None:
+            index = cls.search_index()
+        rows = {obj.id: index.tokens(obj) for obj in cls.select()}
+        return {
+            'missing': rows.keys() - index.documents.keys(),
+            'stale': index.documents.keys() - rows.keys(),
+            'outdated': {
+                key for key, tokens in rows.items()
+                if key in index and index.documents[key] != tokens
+            },
+        }
+
+    @classmethod
+    def _search_keys(cls, *queries, index=None):
+        """
+        Return the sorted keys of the rows that share at least a token with
+        one of the ``queries``, using the given or the model search index.
+        """
+        if index is None:
+            index = cls.search_index()
+        return sorted(set().union(*(index.candidates(query) for query in queries)))
+
+    @classmethod
+    def _search_candidates(cls, dataset, keys):
+        """
+        Narrow down the ``dataset`` query to the rows with the given keys (see
+        :any:`_search_keys`), loaded in chunks to stay below the database
+        variables limit.
+        """
+        size = cls._search_chunk_size
+        for i in range(0, len(keys), size):
+            for obj in dataset.where(cls.id << keys[i:i + size]):
+                yield obj
+
+    @classmethod
+    def search_faceted(cls, query, dataset, field, values=None, limit=-1,
+                       use_index=False, explain=None):
+        """
+        Search the rows of ``dataset`` whose ``field`` is one of ``values``
+        and count the rows of ``dataset`` for each value of ``field`` in one
+        pass: the candidates are loaded once, counted, and only the ones with
+        the requested values are scored.
+
+        Arguments:
+            query (str): the search query
+            dataset (SelectQuery): select query on the callee class
+            field (str): name of the field to count and filter the values of
+            values (list): values of ``field`` of the rows to score, all of
+                them if None.
+            limit (int): maximum number of results (default -1, all)
+            use_index (bool): if True only the rows sharing at least a token
+                with ``query`` are loaded (see :any:`search_index`).
+            explain (search.explain.Explanation): see :any:`BaseModel.search`,
+                the candidates loading time is reported as ``load``.
+
+        Returns:
+            tuple: the list of results and the ``{value: count}`` of the
+            values with at least a row.
+        """
+        def load():
+            rows = dataset
+            if use_index:
+                rows = cls._search_candidates(dataset, cls._search_keys(query))
+            return list(rows)
+
+        if explain is not None:
+            with explain.timer('load'):
+                rows = load()
+        else:
+            rows = load()
+
+        counts = Counter(getattr(obj, field) for obj in rows)
+        if values is not None:
+            rows = [obj for obj in rows if getattr(obj, field) in values]
+        return cls.search(query, rows, limit, explain=explain), dict(counts)
+
+    @classmethod
+    def search_many(cls, queries, dataset, attributes=None,
+                    threshold=search.config.THRESHOLD, use_index=False):
+        """
+        Run several searches on the callee class in a single pass over the
+        dataset, see :func:`search.core.search_many`.
+
+        Arguments:
+            queries (list): dicts with the ``query`` string and the optional
+                ``limit`` and ``weights`` of each search. Missing weights
+                default to the model ``_search_weights``.
+            dataset (iterable): sequence of resource objects to lookup into
+            attributes (list): model attribute names, defaults to the model
+                ``_search_attributes``.
+            threshold (float): value between 0 and 1, identify the matching
+                threshold for a result to be included.
+            use_index (bool): if True only the rows sharing at least a token
+                with one of the queries are loaded, and each row is scored
+                only against the queries it shares tokens with (see
+                :any:`search`).
+
+        Returns:
+            list: the list of results of each query, in the same order.
+
+        Raises:
+            SearchAttributeMismatch: if ``attributes`` are missing.
+        """
+        attributes = attributes or cls._search_attributes
+        if not attributes:
+            raise SearchAttributeMismatch(
+                'Attributes to look for not defined for {}. \
+                Please update the Model or specify during search call.\
+                '.format(cls.__name__))
+
+        queries = [dict(q, weights=q.get('weights') or cls._search_weights)
+                   for q in queries]
+
+        index = None
+        if use_index and set(attributes) <= set(cls._search_attributes or []):
+            index = cls.search_index()
+            keys = cls._search_keys(*(q['query'] for q in queries), index=index)
+            dataset = cls._search_candidates(dataset, keys)
+
+        return search.search_many(queries, attributes, dataset, threshold, index,
+                                  tokenizer=cls.search_token_cache().tokens)
+
+    @classmethod
+    def _search_hydrate(cls, dataset, ids):
+        """Load the rows with the given ``ids`` from ``dataset``, in order."""
+        if not ids:
+            return []
+        rows = {obj.id: obj for obj in dataset.where(cls.id << ids)}
+        return [rows[key] for key in ids if key in rows]
+
     @classmethod
     def search(cls, query, dataset, limit=-1,
                attributes=None, weights=None,
-               threshold=search.config.THRESHOLD):
+               threshold=search.config.THRESHOLD, use_index=False,
+               use_fulltext=False, processes=None, use_cache=False,
+               explain=None):
         """
         Search a list of resources with the callee class.
 
@@ -147,6 +574,26 @@ class BaseModel(Model):
                 if length does not match it will be ignored.
             threshold (float): value between 0 and 1, identify the matching
                 threshold for a result to be included.
+            use_index (bool): if True ``dataset`` (that must be a select query
+                on the callee class) is restricted to the rows sharing at least
+                a token with ``query``, found through :any:`search_index`,
+                before scoring. Ignored if ``attributes`` are not a subset of
+                ``_search_attributes``.
+            use_fulltext (bool): if True and the model defines a
+                ``_search_document``, a coarse full-text filter on the query
+                tokens prefixes is applied by the database, so that only the
+                :any:`config.FULLTEXT_MAX_CANDIDATES` best matching rows are
+                loaded and scored.
+            processes (int): number of worker processes to score large
+                datasets with, see :func:`search.core.search`.
+            use_cache (bool): if True the ids of the results are cached (see
+                :any:`search_result_cache`) until the catalog version changes
+                or they expire, and a cached search only loads them from
+                ``dataset``, that must be a select query on the callee class.
+            explain (search.explain.Explanation): if given, it is filled in
+                with the timings and the match breakdown of the search, see
+                :func:`search.core.search`. The result cache is not used, and
+                the full-text filter runs within the ``load`` stage.
 
         Returns:
             list: list of resources that may match the query.
@@ -173,7 +620,40 @@ class BaseModel(Model):
                 Please update the Model or specify during search call.\
                 '.format(cls.__name__))
 
-        return search.search(query, attributes, dataset, limit, threshold, weights)
+        if use_cache and explain is None:
+            cache = cls.search_result_cache()
+            sql, params = dataset.sql()
+            key = cache.key(query, limit, attributes, weights, threshold,
+                            sql, tuple(params), use_index, use_fulltext)
+            ids = cache.get(key, cls._search_version)
+            if ids is None:
+                # the version is read before searching, a change during the
+                # search leaves an already outdated entry.
+                version = cls._search_version
+                results = cls.search(
+                    query, dataset, limit, attributes, weights, threshold,
+                    use_index, use_fulltext, processes)
+                cache.set(key, version, [obj.id for obj in results])
+                return results
+            return cls._search_hydrate(dataset, ids)
+
+        if use_fulltext and cls._search_document is not None:
+            candidates = cls._search_document.candidates(
+                query, search.config.FULLTEXT_MAX_CANDIDATES)
+            dataset = dataset.where(cls.id << candidates)
+
+        indexed = set(attributes) <= set(cls._search_attributes or [])
+        if use_index and indexed:
+            if explain is not None:
+                with explain.timer('candidates'):
+                    keys = cls._search_keys(query)
+            else:
+                keys = cls._search_keys(query)
+            dataset = cls._search_candidates(dataset, keys)
+
+        return search.search(query, attributes, dataset, limit, threshold, weights,
+                             tokenizer=cls.search_token_cache().tokens,
+                             processes=processes, explain=explain)
 
 
 class Item(BaseModel):
@@ -194,9 +674,13 @@ class Item(BaseModel):
     price = DecimalField(auto_round=True)
     description = TextField()
     availability = IntegerField()
-    category = TextField()
+    category = TextField(index=True)
     _schema = ItemSchema
     _search_attributes = ['name', 'category', 'description']
+    _search_snapshot = SEARCH_SNAPSHOT
+    _search_phonetic = search.config.PHONETIC_ALGORITHM
+    _search_edit_distance = search.config.EDIT_DISTANCE
+    _suggest_attributes = ['name']
 
     def __str__(self):
         return '{}, {}, {}, {}'.format(
@@ -211,11 +695,191 @@ class Item(BaseModel):
                 return True
         return False
 
+    @classmethod
+    def update_availability(cls, quantities):
+        """
+        Subtract the given quantities from the availability of the items with
+        a single conditional ``UPDATE``, executed by the database on the
+        current values so that concurrent orders can't reserve the same
+        items. Availability of the instances is updated as well.
+
+        Args:
+            quantities (dict): ``{item: quantity}`` to reserve, negative
+                quantities are given back to the item availability.
+
+        Raises:
+            InsufficientAvailabilityException: if the availability of an item
+                is lower than its quantity, nothing is updated in that case.
+        """
+        quantities = {item: q for item, q in quantities.items() if q}
+        if not quantities:
+            return
+
+        delta = case(cls.id, [(item.id, q) for item, q in quantities.items()])
+        with cls._meta.database.atomic() as transaction:
+            updated = (cls
+                       .update(availability=cls.availability - delta)
+                       .where(cls.id << [item.id for item in quantities],
+                              cls.availability >= delta)
+                       .execute())
+
+            if updated != len(quantities):
+                # some rows did not match the availability condition
+                transaction.rollback()
+                current = dict(cls
+                               .select(cls.id, cls.availability)
+                               .where(cls.id << [item.id for item in quantities])
+                               .tuples())
+                item, quantity = next(
+                    ((item, q) for item, q in quantities.items()
+                     if current.get(item.id, 0) < q),
+                    next(iter(quantities.items())))
+                item.availability = current.get(item.id, 0)
+                raise InsufficientAvailabilityException(item, quantity)
+
+        for item, quantity in quantities.items():
+            item.availability -= quantity
+
+
+if ENVIRONMENT != 'dev':
+    from playhouse.postgres_ext import TSVectorField
+
+    class ItemDocument(Model):
+        """
+        Full-text document of an :any:`Item`, stored in a GIN indexed
+        ``tsvector`` column so that Postgres can filter the items matching a
+        query before they are loaded and ranked by :mod:`search`.
+
+        Attributes:
+            item (:any:`Item`): the item the document refers to
+            document (tsvector): lexemes of the item ``_search_attributes``
+        """
+        item = ForeignKeyField(Item, primary_key=True, on_delete='CASCADE')
+        document = TSVectorField()
+
+        class Meta:
+            database = database
+
+        @classmethod
+        def store(cls, item):
+            """Create or replace the document of the given item."""
+            text = ' '.join(getattr(item, a) for a in Item._search_attributes)
+            with cls._meta.database.atomic():
+                cls.discard(item.id)
+                cls.insert(item=item.id,
+                           document=fn.to_tsvector('simple', text)).execute()
+
+        @classmethod
+        def discard(cls, item_id):
+            """Delete the document of the given item id, if any."""
+            cls.delete().where(cls.item == item_id).execute()
+
+        @classmethod
+        def candidates(cls, query, limit):
+            """
+            Return a query selecting the ids of the (at most ``limit``) items
+            whose document contains a word starting as one of the query tokens.
+            """
+            prefixes = search.utils.token_prefixes(
+                query, search.config.FULLTEXT_PREFIX_LENGTH)
+            if not prefixes:
+                return cls.select(cls.item).where(SQL('1 = 0'))
+
+            terms = ' | '.join('{}:*'.format(p) for p in prefixes)
+            rank = fn.ts_rank(cls.document, fn.to_tsquery('simple', terms))
+            return (cls
+                    .select(cls.item)
+                    .where(cls.document.match(terms, language='simple'))
+                    .order_by(rank.desc())
+                    .limit(limit))
+
+else:
+    from playhouse.sqlite_ext import FTS5Model, SearchField
+
+    class ItemDocument(FTS5Model):
+        """
+        Full-text document of an :any:`Item`, stored in a SQLite FTS5 virtual
+        table (``rowid`` is the item id) so that SQLite can filter the items
+        matching a query before they are loaded and ranked by :mod:`search`.
+        """
+        name = SearchField()
+        category = SearchField()
+        description = SearchField()
+
+        class Meta:
+            database = database
+            extension_options = {
+                'prefix': str(search.config.FULLTEXT_PREFIX_LENGTH),
+            }
+
+        @classmethod
+        def store(cls, item):
+            """Create or replace the document of the given item."""
+            with cls._meta.database.atomic():
+                cls.discard(item.id)
+                cls.insert(rowid=item.id, name=item.name, category=item.category,
+                           description=item.description).execute()
+
+        @classmethod
+        def discard(cls, item_id):
+            """Delete the document of the given item id, if any."""
+            cls.delete().where(cls.rowid == item_id).execute()
+
+        @classmethod
+        def candidates(cls, query, limit):
+            """
+            Return a query selecting the ids of the (at most ``limit``) items
+            whose document contains a word starting as one of the query tokens.
+            """
+            prefixes = search.utils.token_prefixes(
+                query, search.config.FULLTEXT_PREFIX_LENGTH)
+            if not prefixes:
+                return cls.select(cls.rowid).where(SQL('1 = 0'))
+
+            terms = ' OR '.join('"{}"*'.format(p) for p in prefixes)
+            return (cls
+                    .select(cls.rowid)
+                    .where(cls.match(terms))
+                    .order_by(cls.bm25())
+                    .limit(limit))
+
+
+if SEARCH_FULLTEXT:
+    Item._search_document = ItemDocument
+
+
+@post_save(sender=Item)
+def on_save_item_handler(model_class, instance, created):
+    """
+    Add or update the item in the search index, autocomplete trie and
+    full-text documents
+    """
+    Item.bump_search_version()
+    if Item._search_index is not None:
+        Item._search_index.add(instance)
+    if Item._suggest_trie is not None:
+        Item._suggest_trie.add(instance)
+    if Item._search_document is not None:
+        Item._search_document.store(instance)
+
+
+@post_delete(sender=Item)
+def on_delete_item_index_handler(model_class, instance):
+    """Remove the item from the search index, autocomplete trie and token cache"""
+    Item.bump_search_version()
+    if Item._search_index is not None:
+        Item._search_index.remove(instance.id)
+    if Item._suggest_trie is not None:
+        Item._suggest_trie.remove(instance.id)
+    Item.search_token_cache().discard(instance.id)
+
 
 @database.atomic()
 @pre_delete(sender=Item)
 def on_delete_item_handler(model_class, instance):
-    """Delete item pictures in cascade"""
+    """Delete item pictures and full-text document in cascade"""
+    if Item._search_document is not None:
+        Item._search_document.discard(instance.id)
     pictures = Picture.select().join(Item).where(
         Item.uuid == instance.uuid)
     for pic in pictures:
@@ -387,21 +1051,63 @@ class Order(BaseModel):
     def order_items(self):
         """
         Property that execute a cross-table query against :class:`models.OrderItem`
-        to get a list of all OrderItem related to the callee order.
+        to get a list of all OrderItem related to the callee order, along with
+        their :class:`models.Item`. Orders loaded through
+        :any:`Order.with_items` return the prefetched list instead.
 
         Returns:
             list: :class:`models.OrderItem` related to the order.
         """
+        prefetched = getattr(self, 'orderitem_set_prefetch', None)
+        if prefetched is not None:
+            return prefetched
 
         query = (
             OrderItem
-            .select(OrderItem, Order)
-            .join(Order)
-            .where(Order.uuid == self.uuid)
+            .select(OrderItem, Item)
+            .join(Item)
+            .where(OrderItem.order == self)
         )
 
         return [orderitem for orderitem in query]
 
+    @classmethod
+    def with_items(cls, query=None):
+        """
+        Load the orders of the given query along with their user, delivery
+        address, order items and items, in two queries whatever the number
+        of orders and lines (see :func:`peewee.prefetch`), so that the orders
+        can be serialized without any further query.
+
+        Args:
+            query (peewee.SelectQuery): orders to load, default to all of them.
+
+        Returns:
+            peewee.SelectQuery: the executed orders query.
+        """
+        query = cls.select() if query is None else query
+        orders = (query
+                  .select(cls, User, Address)
+                  .join(User, on=cls.user)
+                  .switch(cls)
+                  .join(Address, on=cls.delivery_address))
+        orderitems = OrderItem.select(OrderItem, Item).join(Item)
+        return prefetch(orders, orderitems)
+
+    def _order_items_by_item(self, items=None):
+        """
+        Return the ``{item id: OrderItem}`` of the order, loaded in a single
+        query along with their items, only the ones of the given ``items``
+        if any.
+        """
+        query = (OrderItem
+                 .select(OrderItem, Item)
+                 .join(Item)
+                 .where(OrderItem.order == self))
+        if items is not None:
+            query = query.where(OrderItem.item << [item.id for item in items])
+        return {orderitem.item_id: orderitem for orderitem in query}
+
     def empty_order(self):
         """
         Remove all the items from the order deleting all OrderItem related
@@ -412,6 +1118,7 @@ class Order(BaseModel):
         """
 
         self.total_price = 0
+        self.orderitem_set_prefetch = None
         OrderItem.delete().where(OrderItem.order == self).execute()
         self.save()
         return self
@@ -419,9 +1126,9 @@ class Order(BaseModel):
     @staticmethod
     def create_order(user, address, items):
         """
-        Create an Order and respective OrderItems. OrderItems are created
-        in a single query as well as the Order. It also updates Items'
-        availability.
+        Create an Order and respective OrderItems. Items' availability is
+        reserved with a single query (see :any:`Item.update_availability`),
+        then the Order and its OrderItems are inserted with one query each.
 
         Args:
             user (models.User): order owner
@@ -438,17 +1145,26 @@ class Order(BaseModel):
 
         Returns:
             models.Order: The new order
+
+        Raises:
+            InsufficientAvailabilityException: if an item availability is
+                lower than its quantity, nothing is created.
+            WrongQuantity: if a quantity is not positive.
         """
+        if any(quantity <= 0 for quantity in items.values()):
+            raise WrongQuantity()
+
         total_price = sum(
             item.price * quantity for item, quantity in items.items())
 
         with database.atomic():
+            Item.update_availability(items)
             order = Order.create(
                 delivery_address=address,
                 user=user,
                 total_price=total_price,
             )
-            order.update_items(items, update_total=False)
+            order.create_items(items, update_availability=False)
             return order
 
     def update_items(self, items, update_total=True, new_address=None):
@@ -475,43 +1191,51 @@ class Order(BaseModel):
 
         Returns:
             models.Order: The new/updated order
+
+        Raises:
+            InsufficientAvailabilityException: if an item availability is
+                lower than the quantity to add, nothing is updated.
+            WrongQuantity: if a quantity is negative, or zero for an item
+                that is not in the order.
         """
         to_create = {}
         to_remove = {}
         to_edit = {}
         total_price_difference = 0
-        orderitems = self.order_items
+        orderitems = self._order_items_by_item()
+        # order items prefetched by `with_items` are outdated from now on
+        self.orderitem_set_prefetch = None
 
         # split items in insert, delete and update sets
         for item, quantity in items.items():
-            for orderitem in orderitems:
-                if orderitem.item == item:
-                    difference = quantity - orderitem.quantity
-                    if quantity == 0:
-                        to_remove[item] = orderitem.quantity
-                    elif difference > item.availability:
-                        raise InsufficientAvailabilityException(
-                            item, quantity)
-                    elif quantity < 0:
-                        raise WrongQuantity()
-                    else:
-                        to_edit[item] = difference
-                    total_price_difference += item.price * difference
-                    break
+            orderitem = orderitems.get(item.id)
+            if orderitem is not None:
+                difference = quantity - orderitem.quantity
+                if quantity == 0:
+                    to_remove[item] = orderitem.quantity
+                elif quantity < 0:
+                    raise WrongQuantity()
+                else:
+                    to_edit[item] = difference
+                total_price_difference += item.price * difference
             else:
                 if quantity <= 0:
                     raise WrongQuantity()
-                elif quantity > item.availability:
-                    raise InsufficientAvailabilityException(
-                        item, quantity)
                 else:
                     to_create[item] = quantity
                 total_price_difference += item.price * quantity
 
+        # availability of all the items is reserved (or given back) at once
+        quantities = dict(to_create)
+        quantities.update(to_edit)
+        quantities.update({item: -q for item, q in to_remove.items()})
+
         with database.atomic():
-            self.edit_items_quantity(to_edit)
-            self.create_items(to_create)
-            self.delete_items(to_remove)
+            Item.update_availability(quantities)
+            self.edit_items_quantity(to_edit, update_availability=False,
+                                     orderitems=orderitems)
+            self.create_items(to_create, update_availability=False)
+            self.delete_items(to_remove, update_availability=False)
             if update_total:
                 self.total_price += total_price_difference
             if new_address:
@@ -521,10 +1245,12 @@ class Order(BaseModel):
         return self
 
     @database.atomic()
-    def edit_items_quantity(self, items):
+    def edit_items_quantity(self, items, update_availability=True, orderitems=None):
         """
-        Update orderitems using a query for each item, and updates
-        items' availability.
+        Update the quantity and subtotal of the orderitems with a single
+        ``UPDATE ... CASE`` query, and updates items' availability (see
+        :any:`Item.update_availability`). Items that are not in the order
+        are skipped.
 
         Args:
             items (dict): item updates entries as a dictionary, keys are
@@ -536,29 +1262,48 @@ class Order(BaseModel):
                         Item.get(pk=1): 3,
                         Item.get(pk=3): 1,
                     }
+            update_availability (bool): if False items' availability is not
+                updated, as already done by the caller. Default to True.
+            orderitems (dict): ``{item id: OrderItem}`` of the order already
+                loaded by the caller (see :any:`Order._order_items_by_item`),
+                loaded from the database if None.
+
         Returns:
             Order: callee instance
         """
         if not items:
             return
 
-        orderitems = OrderItem.select().where(
-            OrderItem.item << [k for k in items.keys()],
-            OrderItem.order == self)
-
-        for orderitem in orderitems:
-            for item, difference in items.items():
-                if orderitem.item == item:
-                    item.availability -= difference
-                    item.save()
-                    orderitem.quantity += difference
-                    orderitem._calculate_subtotal()
-                    orderitem.save()
-                    break
+        if orderitems is None:
+            orderitems = self._order_items_by_item(items)
+        items = {item: difference for item, difference in items.items()
+                 if item.id in orderitems}
+        if not items:
+            return
 
-    def delete_items(self, items):
+        if update_availability:
+            Item.update_availability(items)
+
+        now = datetime.datetime.now()
+        for item, difference in items.items():
+            orderitem = orderitems[item.id]
+            orderitem.item = item
+            orderitem.quantity += difference
+            orderitem._calculate_subtotal()
+            orderitem.updated_at = now
+
+        edited = [orderitems[item.id] for item in items]
+        (OrderItem
+         .update(quantity=case(OrderItem.id, [(oi.id, oi.quantity) for oi in edited]),
+                 subtotal=case(OrderItem.id, [(oi.id, oi.subtotal) for oi in edited]),
+                 updated_at=now)
+         .where(OrderItem.id << [oi.id for oi in edited])
+         .execute())
+
+    def delete_items(self, items, update_availability=True):
         """
-        Delete orderitems in a single query and updates items' availability.
+        Delete orderitems in a single query and gives their quantities back
+        to items' availability (see :any:`Item.update_availability`).
 
         Args:
             items (dict): item entries as a dictionary, keys are
@@ -570,21 +1315,23 @@ class Order(BaseModel):
                         Item.get(pk=1): 3,
                         Item.get(pk=2): 2,
                     }
+            update_availability (bool): if False items' availability is not
+                updated, as already done by the caller. Default to True.
         """
         if not items:
             return
 
         with database.atomic():
-            for item, quantity in items.items():
-                item.availability += quantity
-                item.save()
+            if update_availability:
+                Item.update_availability({item: -q for item, q in items.items()})
             OrderItem.delete().where(
                 OrderItem.order == self).where(
                 OrderItem.item << [k for k in items.keys()]).execute()
 
-    def create_items(self, items):
+    def create_items(self, items, update_availability=True):
         """
-        Creates orderitems in a single query and updates items' availability.
+        Creates orderitems in a single query and reserves their quantities
+        from items' availability (see :any:`Item.update_availability`).
 
         Args:
             items (dict): item entries as a dictionary, keys are
@@ -596,14 +1343,19 @@ class Order(BaseModel):
                         Item.get(pk=1): 3,
                         Item.get(pk=2): 1,
                     }
+            update_availability (bool): if False items' availability is not
+                updated, as already done by the caller. Default to True.
+
+        Raises:
+            InsufficientAvailabilityException: if an item availability is
+                lower than its quantity, nothing is created.
         """
         if not items:
             return
 
         with database.atomic():
-            for item, quantity in items.items():
-                item.availability -= quantity
-                item.save()
+            if update_availability:
+                Item.update_availability(items)
 
             OrderItem.insert_many([
                 {
@@ -676,11 +1428,7 @@ class OrderItem(BaseModel):
                 is higher than the :attr:`models.Item.availability`
         """
 
-        if quantity > self.item.availability:
-            raise InsufficientAvailabilityException(self.item, quantity)
-
-        self.item.availability -= quantity
-        self.item.save()
+        Item.update_availability({self.item: quantity})
 
         self.quantity += quantity
         self._calculate_subtotal()
@@ -0,0 +1,98 @@
+"""
+Benchmark of the BK-tree of the search index (:class:`search.index.BKTree`)
+against a brute force scan of the vocabulary, looking up the tokens within
+a given edit distance of misspelled query tokens.
+
+For each vocabulary size a random vocabulary of distinct tokens is generated,
+then the same queries (vocabulary tokens with a random typo) are run on both,
+checking that the results match and reporting the build time, the average
+time per query and the average number of distance computations of the tree.
+
+    PYTHONPATH=. python3 scripts/bench_bktree.py --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import string
+import time
+
+import jellyfish
+
+from search.index import BKTree
+
+
+def random_token(min_len=5, max_len=10):
+    length = random.randint(min_len, max_len)
+    return ''.join(random.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def typo(token):
+    """Apply a random substitution, insertion or deletion to the token."""
+    i = random.randrange(len(token))
+    char = random.choice(string.ascii_lowercase)
+    edit = random.choice(['substitute', 'insert', 'delete'])
+    if edit == 'substitute':
+        return token[:i] + char + token[i + 1:]
+    if edit == 'insert':
+        return token[:i] + char + token[i:]
+    return token[:i] + token[i + 1:]
+
+
+def brute_force(vocabulary, token, max_distance):
+    distance = jellyfish.levenshtein_distance
+    return {t for t in vocabulary if distance(token, t) <= max_distance}
+
+
+def bench(size, num_queries, max_distance):
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add(random_token())
+    vocabulary = list(vocabulary)
+    queries = [typo(token) for token in random.sample(vocabulary, num_queries)]
+
+    calls = [0]
+
+    def distance(a, b):
+        calls[0] += 1
+        return jellyfish.levenshtein_distance(a, b)
+
+    start = time.perf_counter()
+    tree = BKTree(distance)
+    for token in vocabulary:
+        tree.add(token)
+    build = time.perf_counter() - start
+
+    calls[0] = 0
+    start = time.perf_counter()
+    tree_results = [tree.search(query, max_distance) for query in queries]
+    tree_time = (time.perf_counter() - start) / num_queries
+    tree_calls = calls[0] / num_queries
+
+    start = time.perf_counter()
+    scan_results = [brute_force(vocabulary, query, max_distance) for query in queries]
+    scan_time = (time.perf_counter() - start) / num_queries
+
+    assert tree_results == scan_results, 'BK-tree and scan results differ'
+
+    print('{:>9} tokens  build {:7.2f}s  bktree {:8.2f}ms ({:6.0f} distances, {:5.1%})'
+          '  scan {:8.2f}ms  {:5.1f}x'.format(
+              size, build, tree_time * 1000, tree_calls, tree_calls / size,
+              scan_time * 1000, scan_time / tree_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--distance', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=9623954)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    print('max edit distance {}, {} queries'.format(args.distance, args.queries))
+    for size in args.sizes:
+        bench(size, args.queries, args.distance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Microbenchmark for the memoized Jaro-Winkler of the search engine
+(:func:`search.utils.jaro_winkler`).
+
+Runs the same query set, made of repeated and overlapping queries, against a
+synthetic in-memory catalog with the plain ``jaro_winkler`` and with the memo
+table, reporting the elapsed time and the memo table statistics.
+
+Jellyfish ships both a C extension and a pure python implementation (used
+when the extension is not available, as on PyPy): ``--backend`` selects the one
+to benchmark.
+
+    PYTHONPATH=. python3 scripts/bench_jaro_winkler.py --items 2000 --backend python
+"""
+from collections import namedtuple
+import argparse
+import functools
+import random
+import string
+import time
+
+import jellyfish
+from jellyfish import _jellyfish
+
+import search
+from search import utils
+
+
+Doc = namedtuple('Doc', ['id', 'name', 'category', 'description'])
+
+ATTRIBUTES = ['name', 'category', 'description']
+BACKENDS = {
+    'c': jellyfish.jaro_winkler,
+    'python': _jellyfish.jaro_winkler,
+}
+
+
+def random_word(min_len=5, max_len=10):
+    length = random.randint(min_len, max_len)
+    return ''.join(random.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def generate_queries(vocabulary, num_queries):
+    """
+    Queries share their words: each one is built from a small pool of words,
+    and every query is repeated a few times, as popular searches are.
+    """
+    pool = random.sample(vocabulary, 10)
+    queries = [' '.join(random.sample(pool, random.randint(1, 3)))
+               for _ in range(num_queries)]
+    return queries * 3
+
+
+def run(queries, docs, jaro_winkler, vectorized):
+    utils.jaro_winkler = jaro_winkler
+    start = time.perf_counter()
+    for query in queries:
+        search.search(query, ATTRIBUTES, docs, 10, vectorized=vectorized)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--vocabulary', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=9623954)
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='c')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    vocabulary = [random_word() for _ in range(args.vocabulary)]
+    docs = [
+        Doc(i, ' '.join(random.sample(vocabulary, 3)), random.choice(vocabulary),
+            ' '.join(random.sample(vocabulary, 8)))
+        for i in range(args.items)
+    ]
+    queries = generate_queries(vocabulary, args.queries)
+
+    backend = BACKENDS[args.backend]
+    original = utils.jaro_winkler
+    memoized = functools.lru_cache(maxsize=original.cache_info().maxsize)(backend)
+
+    print('{} queries on {} items, {} jaro_winkler'.format(
+        len(queries), len(docs), args.backend))
+    for vectorized in (False, True):
+        memoized.cache_clear()
+        plain = run(queries, docs, backend, vectorized)
+        memo = run(queries, docs, memoized, vectorized)
+
+        print('vectorized={}'.format(vectorized))
+        print('    plain:    {:.3f}s'.format(plain))
+        print('    memoized: {:.3f}s ({:.2f}x)'.format(memo, plain / memo))
+        print('    {}'.format(memoized.cache_info()))
+
+    utils.jaro_winkler = original
+
+
+if __name__ == '__main__':
+    main()
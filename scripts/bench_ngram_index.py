@@ -0,0 +1,90 @@
+"""
+Benchmark the n-gram candidate pre-filter of the search engine against the
+plain linear scan of :func:`search.core.search`.
+
+Items are generated in memory (no database involved) with names built from a
+random vocabulary, and queried with misspelled versions of vocabulary words.
+Run with:
+
+    PYTHONPATH=. python3 scripts/bench_ngram_index.py --items 100000
+"""
+from collections import namedtuple
+import argparse
+import random
+import string
+import time
+
+import search
+from search.index import InvertedIndex
+
+
+Doc = namedtuple('Doc', ['id', 'name', 'category', 'description'])
+
+ATTRIBUTES = ['name', 'category', 'description']
+CATEGORIES = ['scarpe', 'accessori', 'abbigliamento uomo', 'abbigliamento donna']
+
+
+def random_word(min_len=5, max_len=10):
+    length = random.randint(min_len, max_len)
+    return ''.join(random.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def misspell(word):
+    """Drop a random character from the word, as in `sneaker -> sneakr`."""
+    i = random.randrange(len(word))
+    return word[:i] + word[i + 1:]
+
+
+def generate_docs(num_items, vocabulary):
+    return [
+        Doc(
+            id=i,
+            name=' '.join(random.sample(vocabulary, 3)),
+            category=random.choice(CATEGORIES),
+            description=' '.join(random.sample(vocabulary, 8)),
+        ) for i in range(num_items)
+    ]
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=9623954)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    vocabulary = list({random_word() for _ in range(args.vocabulary)})
+    docs = generate_docs(args.items, vocabulary)
+    queries = [misspell(random.choice(vocabulary)) for _ in range(args.queries)]
+
+    index, elapsed = timed(InvertedIndex(ATTRIBUTES).build, docs)
+    print('{} items, {} tokens: index built in {:.2f}s'.format(
+        len(index), len(index.postings), elapsed))
+
+    for query in queries:
+        candidates, t_candidates = timed(index.candidates, query)
+        linear, t_linear = timed(search.search, query, ATTRIBUTES, docs, 10)
+        indexed, t_indexed = timed(
+            search.search, query, ATTRIBUTES, docs, 10, index=index)
+
+        # share of the linear scan results found through the index as well
+        linear_ids = {d.id for d in linear}
+        found = linear_ids & {d.id for d in indexed}
+        recall = len(found) / len(linear_ids) if linear_ids else 1
+
+        print('{:<12} linear {:8.3f}s | indexed {:8.3f}s ({} candidates in '
+              '{:.4f}s) | recall@10 {:.2f}'.format(
+                  query, t_linear, t_indexed, len(candidates), t_candidates,
+                  recall))
+
+
+if __name__ == '__main__':
+    main()
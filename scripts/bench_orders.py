@@ -0,0 +1,126 @@
+"""
+Benchmark of the order editing endpoint (``PATCH /orders/<uuid>``) on orders
+with hundreds of lines.
+
+Each run creates an order with the given number of lines on a temporary
+SQLite database, then PATCHes it editing a third of the lines, removing
+another third and adding as many new items, reporting the time of the request
+and the number of SQL statements it executed.
+
+    PYTHONPATH=. python3 scripts/bench_orders.py --lines 100 300 600
+"""
+from base64 import b64encode
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from playhouse.sqlite_ext import SqliteExtDatabase
+
+import app as app_module
+import models
+import views.orders
+from models import Address, Item, Order, User
+from scripts.demo_content import fake, fake_item, set_db
+from scripts.init_db import create_tables
+
+
+PASSWORD = 'bench-password'
+
+
+class QueryCounter(logging.Handler):
+    """Count the statements logged by peewee."""
+
+    def __init__(self):
+        super(QueryCounter, self).__init__()
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def use_database(path):
+    """Point the models and the views to a new SQLite database."""
+    database = SqliteExtDatabase(path)
+    set_db(database)
+    models.database = views.orders.database = app_module.database = database
+    database.connect()
+    create_tables()
+    return database
+
+
+def create_order(user, address, lines):
+    items = [Item.create(**dict(fake_item(), availability=1000))
+             for _ in range(lines * 4 // 3)]
+    order = Order.create_order(user, address, {item: 2 for item in items[:lines]})
+    return order, items
+
+
+def patch_payload(items, lines):
+    """Edit the first third of the lines, remove the second and add new items."""
+    third = lines // 3
+    quantities = [(item, 5) for item in items[:third]]
+    quantities += [(item, 0) for item in items[third:2 * third]]
+    quantities += [(item, 1) for item in items[lines:]]
+    return {'data': {
+        'type': 'order',
+        'attributes': {},
+        'relationships': {'items': {'data': [
+            {'type': 'item', 'id': str(item.uuid), 'quantity': quantity}
+            for item, quantity in quantities]}},
+    }}
+
+
+def bench(client, user, address, lines, repeat, counter):
+    headers = {'Authorization': 'Basic ' + b64encode(
+        '{}:{}'.format(user.email, PASSWORD).encode()).decode()}
+    timings, queries = [], []
+    for _ in range(repeat):
+        order, items = create_order(user, address, lines)
+        data = json.dumps(patch_payload(items, lines))
+
+        counter.count = 0
+        start = time.perf_counter()
+        resp = client.patch('/orders/{}'.format(order.uuid), data=data,
+                            headers=headers, content_type='application/json')
+        timings.append(time.perf_counter() - start)
+        queries.append(counter.count)
+        assert resp.status_code == 200, resp.data
+
+    print('{:>6} lines  PATCH {:9.2f}ms  {:6} queries'.format(
+        lines, statistics.median(timings) * 1000, max(queries)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--lines', type=int, nargs='+', default=[100, 300, 600])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=9623954)
+    args = parser.parse_args()
+
+    fake.seed(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        use_database(os.path.join(tmp, 'bench.db'))
+        user = User.create(uuid=uuid.uuid4(), first_name='Bench', last_name='User',
+                           email='bench@example.com',
+                           password=User.hash_password(PASSWORD))
+        address = Address.create(uuid=uuid.uuid4(), user=user, country='Italy',
+                                 city='Pistoia', post_code='51100',
+                                 address='Via Verdi 12', phone='3294882773')
+
+        counter = QueryCounter()
+        logger = logging.getLogger('peewee')
+        logger.addHandler(counter)
+        logger.setLevel(logging.DEBUG)
+
+        client = app_module.app.test_client()
+        for lines in args.lines:
+            bench(client, user, address, lines, args.repeat, counter)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Latency and relevance benchmark of :func:`search.core.search` on synthetic
+catalogs, with a machine readable report to compare commits.
+
+For each catalog size the items are generated in memory (no database
+involved) with the same Faker setup of ``scripts/demo_content.py``, then a
+labeled query set is replayed on each search mode (linear scan, vectorized,
+indexed, parallel), reporting the p50/p95/p99 latency, the throughput and the
+recall and nDCG of the first ``limit`` results.
+
+Queries are one or two words of the name of a random item, half of them with
+a typo. An item is relevant to a query if it contains all the (correct) words:
+with grade 2 if they are all in its name, 1 if they are in any attribute.
+
+    PYTHONPATH=. python3 scripts/bench_search.py --sizes 1000 10000 --output bench.json
+    PYTHONPATH=. python3 scripts/bench_search.py --baseline bench.json
+
+The JSON report goes to stdout (or ``--output``), the summary to stderr. With
+``--baseline`` the summary also shows the change from a previous report.
+"""
+from collections import namedtuple
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import time
+
+import numpy
+
+import search
+from models import Item
+from scripts.demo_content import fake, fake_item
+from search import parallel, utils
+from search.index import InvertedIndex
+
+
+ATTRIBUTES = list(Item._search_attributes)
+MODES = ['scan', 'vectorized', 'index', 'parallel']
+
+Doc = namedtuple('Doc', ['id'] + ATTRIBUTES)
+
+
+def generate_docs(size):
+    docs = []
+    for i in range(size):
+        fields = fake_item()
+        docs.append(Doc(id=i, **{attr: fields[attr] for attr in ATTRIBUTES}))
+    return docs
+
+
+def typo(token, rng):
+    """Apply a random substitution, insertion or deletion to the token."""
+    i = rng.randrange(len(token))
+    char = rng.choice(string.ascii_lowercase)
+    edit = rng.choice(['substitute', 'insert', 'delete'])
+    if edit == 'substitute':
+        return token[:i] + char + token[i + 1:]
+    if edit == 'insert':
+        return token[:i] + char + token[i:]
+    return token[:i] + token[i + 1:]
+
+
+def query_set(docs, num_queries, rng):
+    """
+    Return ``num_queries`` labeled queries: dicts with the ``query`` string,
+    its ``kind`` (``exact`` or ``typo``) and the ``relevant`` ``{id: grade}``.
+    """
+    names = [set(utils.tokenize(doc.name.lower())) for doc in docs]
+    tokens = [set().union(*utils.tokenize_attributes(doc, ATTRIBUTES)) for doc in docs]
+
+    queries = []
+    while len(queries) < num_queries:
+        words = sorted(names[rng.randrange(len(docs))])
+        if not words:
+            continue
+        terms = set(rng.sample(words, min(len(words), rng.choice([1, 2]))))
+        kind = 'typo' if len(queries) % 2 else 'exact'
+        text = ' '.join(typo(t, rng) if kind == 'typo' else t for t in sorted(terms))
+
+        relevant = {}
+        for doc, name, doc_tokens in zip(docs, names, tokens):
+            if terms <= name:
+                relevant[doc.id] = 2
+            elif terms <= doc_tokens:
+                relevant[doc.id] = 1
+        queries.append({'query': text, 'kind': kind, 'relevant': relevant})
+    return queries
+
+
+def recall(results, relevant, k):
+    """Relevant results in the first ``k``, over the relevant ones that fit."""
+    hits = sum(1 for key in results[:k] if key in relevant)
+    return hits / min(k, len(relevant))
+
+
+def ndcg(results, relevant, k):
+    """Normalized discounted cumulative gain of the first ``k`` results."""
+    def dcg(grades):
+        return sum((2 ** g - 1) / math.log2(i + 2) for i, g in enumerate(grades))
+
+    ideal = dcg(sorted(relevant.values(), reverse=True)[:k])
+    return dcg([relevant.get(key, 0) for key in results[:k]]) / ideal
+
+
+def run(mode, docs, queries, limit, repeat, processes):
+    """Replay the queries on the given search mode and return its report."""
+    options = {}
+    build = 0
+    if mode == 'vectorized':
+        options['vectorized'] = True
+    elif mode == 'parallel':
+        options['processes'] = processes
+    elif mode == 'index':
+        start = time.perf_counter()
+        options['index'] = InvertedIndex(
+            ATTRIBUTES, phonetic=Item._search_phonetic,
+            edit_distance=Item._search_edit_distance).build(docs)
+        build = time.perf_counter() - start
+
+    # each mode starts from a cold jaro-winkler memo table
+    utils.jaro_winkler.cache_clear()
+    latencies, scores = [], {'exact': [], 'typo': []}
+    total = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            results = search.search(query['query'], ATTRIBUTES, docs, limit, **options)
+            latencies.append(time.perf_counter() - start)
+
+            keys = [doc.id for doc in results]
+            scores[query['kind']].append((
+                recall(keys, query['relevant'], limit),
+                ndcg(keys, query['relevant'], limit)))
+    total = time.perf_counter() - total
+
+    p50, p95, p99 = numpy.percentile(latencies, [50, 95, 99]) * 1000
+    report = {
+        'mode': mode,
+        'size': len(docs),
+        'build_s': round(build, 4),
+        'latency_ms': {
+            'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3),
+            'mean': round(numpy.mean(latencies) * 1000, 3),
+        },
+        'throughput_qps': round(len(latencies) / total, 2),
+    }
+    for kind, values in [('all', scores['exact'] + scores['typo'])] + sorted(scores.items()):
+        report.setdefault('relevance', {})[kind] = {
+            'recall': round(numpy.mean([r for r, _ in values]), 4),
+            'ndcg': round(numpy.mean([n for _, n in values]), 4),
+        }
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summary(report, baseline=None):
+    """Print one line per size and mode, with the change from the baseline."""
+    previous = {}
+    if baseline:
+        previous = {(r['size'], r['mode']): r for r in baseline['results']}
+
+    for result in report['results']:
+        line = ('{size:>8} {mode:<10} p50 {p50:8.2f}ms  p95 {p95:8.2f}ms  '
+                'p99 {p99:8.2f}ms  {qps:8.1f} q/s  recall {recall:.3f}  '
+                'ndcg {ndcg:.3f}').format(
+            size=result['size'], mode=result['mode'], qps=result['throughput_qps'],
+            **result['latency_ms'], **result['relevance']['all'])
+
+        old = previous.get((result['size'], result['mode']))
+        if old:
+            line += '  | p95 {:+.1%}  ndcg {:+.3f}'.format(
+                result['latency_ms']['p95'] / old['latency_ms']['p95'] - 1,
+                result['relevance']['all']['ndcg'] - old['relevance']['all']['ndcg'])
+        print(line, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--modes', nargs='+', choices=MODES,
+                        default=['scan', 'vectorized', 'index'])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='times the query set is replayed')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=9623954)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--baseline', help='JSON report to compare with')
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'seed': args.seed,
+            'queries': args.queries,
+            'repeat': args.repeat,
+            'limit': args.limit,
+        },
+        'results': [],
+    }
+    for size in args.sizes:
+        fake.seed(args.seed)
+        random.seed(args.seed)
+        docs = generate_docs(size)
+        queries = query_set(docs, args.queries, random.Random(args.seed))
+        for mode in args.modes:
+            report['results'].append(
+                run(mode, docs, queries, args.limit, args.repeat, args.processes))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fo:
+            baseline = json.load(fo)
+    summary(report, baseline)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fo:
+            fo.write(output + '\n')
+    else:
+        print(output)
+
+    parallel.shutdown()
+
+
+if __name__ == '__main__':
+    main()
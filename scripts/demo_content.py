@@ -5,7 +5,8 @@ and supply a new one db with new down-to-earth data.
 
 from peewee import fn
 from faker import Factory
-from models import User, Item, Order, OrderItem, Address, Picture, Favorite
+from models import (User, Item, ItemDocument, Order, OrderItem, Address,
+                    Picture, Favorite)
 import utils
 import argparse
 import glob
@@ -48,6 +49,7 @@ def get_random_pictures(num_pictures):
 def set_db(database):
     Order._meta.database = database
     Item._meta.database = database
+    ItemDocument._meta.database = database
     OrderItem._meta.database = database
     User._meta.database = database
     Address._meta.database = database
@@ -75,22 +77,24 @@ def user_creator(num_user):
         )
 
 
+ITEM_CATEGORIES = ['scarpe', 'accessori', 'abbigliamento uomo', 'abbigliamento donna']
+
+
+def fake_item():
+    """Return the fields of a random item, without saving it."""
+    return {
+        'uuid': fake.uuid4(),
+        'name': fake.sentence(nb_words=3, variable_nb_words=True),
+        'price': fake.pyfloat(left_digits=2, right_digits=2, positive=True),
+        'category': random.choice(ITEM_CATEGORIES),
+        'description': fake.paragraph(nb_sentences=3, variable_nb_sentences=True),
+        'availability': random.randint(35, 60),
+    }
+
+
 def item_creator(num_item):
-    LIST_CATEGORIES = ['scarpe', 'accessori', 'abbigliamento uomo', 'abbigliamento donna']
     for i in range(num_item):
-        item_id = fake.uuid4()
-        item_name = fake.sentence(nb_words=3, variable_nb_words=True)
-        item_price = fake.pyfloat(left_digits=2, right_digits=2, positive=True)
-        item_category = random.choice(LIST_CATEGORIES)
-        item = Item.create(
-            uuid=item_id,
-            name=item_name,
-            price=item_price,
-            description=fake.paragraph(
-                nb_sentences=3, variable_nb_sentences=True),
-            availability=random.randint(35, 60),
-            category=item_category,
-        )
+        item = Item.create(**fake_item())
         picture_creator(num_item, i, item)
 
 
@@ -1,6 +1,6 @@
 from colorama import init, Fore, Style
 import sys
-from models import (User, Item, Order, OrderItem,
+from models import (User, Item, ItemDocument, Order, OrderItem,
                     Address, Picture, database, Favorite)
 
 
@@ -10,6 +10,8 @@ init(autoreset=True)
 def drops_all_tables(database):
     """Doesn't drop unknown tables."""
     tables = database.get_tables()
+    if 'itemdocument' in tables:
+        ItemDocument.drop_table()
     for table in tables:
         if table == 'item':
             Item.drop_table()
@@ -30,6 +32,7 @@ def drops_all_tables(database):
 def create_tables():
     User.create_table(fail_silently=True)
     Item.create_table(fail_silently=True)
+    ItemDocument.create_table(fail_silently=True)
     Address.create_table(fail_silently=True)
     Order.create_table(fail_silently=True)
     OrderItem.create_table(fail_silently=True)
@@ -0,0 +1,105 @@
+"""
+Maintenance of the Item search index snapshot and full-text documents.
+
+Each process builds its search index from the ``item`` table on the first
+indexed search (or opens the snapshot, if up to date) and keeps it up to date
+by itself, so the commands below work on what is shared between processes:
+
+``rebuild`` saves the index snapshot to the file that processes open on start
+(``SEARCH_SNAPSHOT`` environment variable or ``--path``) and recreates the
+database full-text documents (:any:`ItemDocument`) if ``SEARCH_FULLTEXT`` is
+set. ``snapshot`` only saves the snapshot. ``check`` compares the snapshot
+against the table, reporting the items that are missing, stale or outdated.
+
+To run the script, use the command:
+
+    PYTHONPATH=. python3 scripts/search_index.py {rebuild,check,snapshot}
+"""
+import argparse
+import sys
+import time
+
+from colorama import init, Fore, Style
+
+from models import SEARCH_SNAPSHOT, Item, ItemDocument, database
+import search
+
+
+init(autoreset=True)
+
+
+def require_path(path):
+    if not path:
+        print(Fore.RED + 'Missing snapshot path: set SEARCH_SNAPSHOT or --path')
+        sys.exit(1)
+
+
+def rebuild(path):
+    if path:
+        snapshot(path)
+    elif Item._search_document is None:
+        require_path(path)
+    else:
+        print(Fore.YELLOW + 'No snapshot path: each process builds its own index')
+
+    if Item._search_document is None:
+        return
+
+    start = time.perf_counter()
+    with database.atomic():
+        ItemDocument.delete().execute()
+        for item in Item.select():
+            ItemDocument.store(item)
+    print(Fore.GREEN + Style.BRIGHT +
+          'Full-text documents rebuilt in {:.2f}s'.format(
+              time.perf_counter() - start))
+
+
+def check(path):
+    require_path(path)
+    try:
+        index = search.snapshot.load(path)
+    except (OSError, ValueError) as exc:
+        print(Fore.RED + 'Cannot load the snapshot {}: {}'.format(path, exc))
+        sys.exit(1)
+
+    diff = Item.check_search_index(index)
+    for name, ids in sorted(diff.items()):
+        color = Fore.RED if ids else Fore.GREEN
+        print(color + '{:<9} {} {}'.format(name, len(ids), sorted(ids)))
+
+    if any(diff.values()):
+        sys.exit(1)
+
+
+def snapshot(path):
+    require_path(path)
+
+    start = time.perf_counter()
+    index = Item.save_search_snapshot(path)
+    print(Fore.GREEN + Style.BRIGHT +
+          'Search index snapshot saved to {}: {} items in {:.2f}s'.format(
+              path, len(index), time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rebuild or check the Item search index snapshot.')
+    parser.add_argument('command', choices=['rebuild', 'check', 'snapshot'])
+    parser.add_argument('--path', default=SEARCH_SNAPSHOT,
+                        help='snapshot file (default: SEARCH_SNAPSHOT)')
+    args = parser.parse_args()
+
+    if database.is_closed():
+        database.connect()
+
+    if args.command == 'rebuild':
+        rebuild(args.path)
+    elif args.command == 'snapshot':
+        snapshot(args.path)
+    else:
+        check(args.path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""
+Serve a shard of the Item search index (see :mod:`search.sharded`) on the
+given host and port, until its coordinator closes it.
+
+The shard starts empty: the coordinator, a :class:`search.sharded.ShardedIndex`
+created with the addresses of all the shards and the same key, sends it the
+items whose id hashes to it.
+
+    SEARCH_SHARD_KEY=secret PYTHONPATH=. python3 scripts/search_shard.py --port 6001
+"""
+import argparse
+import os
+
+from models import Item
+from search.sharded import serve
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, required=True)
+    args = parser.parse_args()
+
+    authkey = os.environ['SEARCH_SHARD_KEY'].encode()
+    print('Serving search shard on {}:{}'.format(args.host, args.port))
+    serve((args.host, args.port), authkey, Item._search_attributes,
+          Item._search_phonetic, Item._search_edit_distance)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,7 @@
-from search.core import search  # noqa: F401
+from search.core import search, search_many  # noqa: F401
+from search.index import InvertedIndex  # noqa: F401
+from search.cache import ResultCache, TokenCache  # noqa: F401
+from search.snapshot import SnapshotIndex  # noqa: F401
+from search.trie import CompletionTrie  # noqa: F401
+from search.explain import Explanation  # noqa: F401
+from search.sharded import ShardedIndex  # noqa: F401
@@ -0,0 +1,125 @@
+"""
+Asyncio front end of the search engine.
+
+Loading and scoring are blocking and CPU bound, so the dataset is loaded in
+a single executor call (the default executor of the loop, a thread pool,
+unless given) and then scored in chunks of :any:`config.ASYNC_CHUNK_SIZE`
+objects on the executor: the loop is free to serve other requests meanwhile,
+the best matches found so far can be streamed after each chunk, and
+cancelling the search (as servers do when the client disconnects) stops it
+once the running chunk is done.
+
+Database queries (such as ``Item.select()``) are loaded entirely by one
+executor thread, that uses its own connection, since chunks can be scored by
+different threads.
+
+Chunks are scored with the same functions of :func:`search.core.search`,
+and the results are the same.
+"""
+import asyncio
+
+from search import config, core, utils
+
+
+def _score_chunk(chunk, offset, query, attributes, weights, limit,
+                 threshold, candidates, key, tokenize):
+    """
+    Score the objects of ``chunk``, skipping the ones whose ``key`` is not
+    in ``candidates`` (if given). Runs on the executor, so that the loop
+    never tokenizes the objects.
+
+    Returns:
+        list: the ``(match, position)`` pairs of the best objects, positions
+        starting from ``offset``.
+    """
+    if candidates is not None:
+        positions = [i for i, obj in enumerate(chunk) if key(obj) in candidates]
+    else:
+        positions = list(range(len(chunk)))
+
+    documents = [tokenize(chunk[i], attributes) for i in positions]
+    matches = core._score_shard(0, documents, query, attributes, weights,
+                                limit, threshold, False)
+    return [(match, offset + positions[i]) for match, i in matches]
+
+
+async def search_stream(query, attributes, dataset, limit=-1,
+                        threshold=config.THRESHOLD, weights=None, index=None,
+                        tokenizer=None, executor=None, chunk_size=None, loop=None):
+    """
+    Asynchronous generator of the partial results of a search: after each
+    scored chunk with any match, it yields the best matches found so far,
+    sorted by relevance. The last list yielded is the result of
+    :func:`search.core.search` with the same arguments.
+
+    Arguments:
+        query, attributes, dataset, limit, threshold, weights, index,
+        tokenizer: see :func:`search.core.search`.
+        executor (concurrent.futures.Executor): executor that loads the
+            dataset, tokenizes and scores the chunks, defaults to the loop
+            one. The dataset is loaded in the executor, so it must be a
+            thread pool.
+        chunk_size (int): objects per chunk, defaults to
+            :any:`config.ASYNC_CHUNK_SIZE`.
+        loop (asyncio.AbstractEventLoop): defaults to the current loop.
+
+    Example:
+        >>> async for results in search_stream('divano', ['name'], items, 10):
+        ...     await websocket.send(Item.json_list(results))
+    """
+    loop = loop or asyncio.get_event_loop()
+    chunk_size = chunk_size or config.ASYNC_CHUNK_SIZE
+    weights = core._attribute_weights(attributes, weights)
+    threshold = threshold or 0
+    tokenize = tokenizer or utils.tokenize_attributes
+
+    candidates = key = None
+    if index is not None:
+        candidates = await loop.run_in_executor(executor, index.candidates, query)
+        key = index.key
+
+    objects = await loop.run_in_executor(executor, list, dataset)
+    top = core._TopK(limit) if limit > 0 else None
+    matches = []
+    for offset in range(0, len(objects), chunk_size):
+        # the search stops here if the task is cancelled, the running chunk
+        # is completed by the executor and discarded.
+        chunk = objects[offset:offset + chunk_size]
+        scored = await loop.run_in_executor(
+            executor, _score_chunk, chunk, offset, query, attributes, weights,
+            limit, threshold, candidates, key, tokenize)
+
+        # pushed in the dataset order, so that on equal match the first
+        # object wins as in the synchronous search.
+        scored.sort(key=lambda m: m[1])
+        for match, position in scored:
+            obj = chunk[position - offset]
+            if top is not None:
+                top.push(obj, match)
+            else:
+                matches.append((obj, match))
+
+        if scored:
+            if top is not None:
+                yield top.results()
+            else:
+                yield [obj for obj, _ in sorted(
+                    matches, key=lambda m: m[1], reverse=True)]
+
+
+async def search(query, attributes, dataset, limit=-1,
+                 threshold=config.THRESHOLD, weights=None, index=None,
+                 tokenizer=None, executor=None, chunk_size=None, loop=None):
+    """
+    Coroutine running :func:`search_stream` to the end, returns the same
+    results of :func:`search.core.search` without blocking the loop.
+
+    Example:
+        >>> results = await search.aio.search('divano', ['name'], items, 10)
+    """
+    results = []
+    async for results in search_stream(
+            query, attributes, dataset, limit, threshold, weights, index,
+            tokenizer, executor, chunk_size, loop):
+        pass
+    return results
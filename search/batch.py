@@ -0,0 +1,163 @@
+"""
+Vectorized scoring for the search engine.
+
+Implements the same algorithm of :func:`search.core.similarity` on a batch of
+pre-tokenized documents at once: the query is tokenized only once, the
+Jaro-Winkler value is computed once for each distinct (query token, document
+token) pair and the positional and weighted average math is done with NumPy
+arrays over all the documents.
+
+Scores match the ones of :func:`search.core.similarity` within float
+tolerance.
+"""
+import numpy as np
+
+from search import config, utils
+
+
+def _first_positions(tokens):
+    """
+    Return the unique tokens of the list, in order of first occurrence, with
+    the position of their first occurrence (as ``list.index`` would).
+    """
+    positions = {}
+    for i, token in enumerate(tokens):
+        positions.setdefault(token, i)
+    return list(positions), list(positions.values())
+
+
+def _positional(longest_pos, shortest_pos, longest_len, shortest_len):
+    """
+    Vectorized :func:`search.utils.position_similarity`, positions are the
+    indexes of the first occurrences of the tokens in their phrases.
+    """
+    max_moves = np.maximum(longest_pos, longest_len - longest_pos - 1)
+    moves = np.abs(longest_pos - shortest_pos)
+    positional = np.abs(1 - moves / np.maximum(max_moves, 1))
+    return np.where(shortest_len == 1, 1.0, positional)
+
+
+def _reduce(values, mask):
+    """Mean of the valid values multiplied by their max, for each row."""
+    values = np.where(mask, values, 0.0)
+    count = mask.sum(axis=1)
+    mean = values.sum(axis=1) / np.maximum(count, 1)
+    return mean * values.max(axis=1)
+
+
+def similarity_batch(query_tokens, documents):
+    """
+    Calculate :func:`search.core.similarity` between the tokenized query and
+    each one of the tokenized strings.
+
+    Arguments:
+        query_tokens (list): tokens of the query, as returned by
+            :func:`search.utils.tokenize`
+        documents (list): list of token lists to match the query against
+
+    Returns:
+        numpy.ndarray: similarity value for each document
+    """
+    num_docs = len(documents)
+    result = np.zeros(num_docs)
+    query_len = len(query_tokens)
+    if query_len == 0 or num_docs == 0:
+        return result
+
+    query_unique, query_pos = _first_positions(query_tokens)
+    query_pos = np.array(query_pos)
+
+    # padded (docs x tokens) arrays with the vocabulary id and the position of
+    # the first occurrence of each token, `first` marks the first occurrences.
+    max_len = max(max(len(doc) for doc in documents), 1)
+    vocabulary = {}
+    ids = np.zeros((num_docs, max_len), dtype=int)
+    positions = np.zeros((num_docs, max_len))
+    first = np.zeros((num_docs, max_len), dtype=bool)
+    lengths = np.zeros(num_docs)
+    for d, doc in enumerate(documents):
+        lengths[d] = len(doc)
+        seen = {}
+        for k, token in enumerate(doc):
+            ids[d, k] = vocabulary.setdefault(token, len(vocabulary))
+            positions[d, k] = seen.setdefault(token, k)
+            first[d, k] = seen[token] == k
+
+    if not vocabulary:
+        return result
+
+    # jaro winkler for each (query token, vocabulary token) pair, the function
+    # is symmetric so the same table serves both query/doc orientations.
+    jw = np.array([
+        [utils.jaro_winkler(token, q) for token in vocabulary]
+        for q in query_unique
+    ])
+
+    # (docs x query tokens x doc tokens) jaro winkler values
+    matrix = jw[:, ids].transpose(1, 0, 2)
+    valid = np.arange(max_len)[np.newaxis, :] < lengths[:, np.newaxis]
+    match_weight, dist_weight = config.MATCH_WEIGHT, config.DIST_WEIGHT
+    total_weight = match_weight + dist_weight
+
+    # document is the longest (or equal) phrase: best query token for each
+    # unique document token.
+    best_q = matrix.argmax(axis=1)
+    best_jw = matrix.max(axis=1)
+    positional = _positional(
+        positions, query_pos[best_q],
+        lengths[:, np.newaxis], query_len)
+    values = (best_jw * match_weight + positional * dist_weight) / total_weight
+    doc_longest = _reduce(values, valid & first)
+
+    # query is the longest phrase: best document token for each unique query
+    # token, padding excluded from the candidates.
+    masked = np.where(valid[:, np.newaxis, :], matrix, -1.0)
+    best_k = masked.argmax(axis=2)
+    best_jw = masked.max(axis=2)
+    doc_pos = positions[np.arange(num_docs)[:, np.newaxis], best_k]
+    positional = _positional(
+        query_pos[np.newaxis, :], doc_pos,
+        query_len, lengths[:, np.newaxis])
+    values = (best_jw * match_weight + positional * dist_weight) / total_weight
+    query_longest = _reduce(values, np.ones(values.shape, dtype=bool))
+
+    result = np.where(lengths >= query_len, doc_longest, query_longest)
+    return np.where(lengths == 0, 0.0, result)
+
+
+def score_batch(query, documents, weights):
+    """
+    Score a batch of tokenized documents against the query, as done by
+    :func:`search.core.search` for each object: the attribute with the highest
+    similarity is taken and multiplied by its weight.
+
+    Arguments:
+        query (str): search query
+        documents (list): tokenized documents, each one a list with the
+            tokens of each attribute (see
+            :func:`search.utils.tokenize_attributes`)
+        weights (list): weight of each attribute of the documents
+
+    Returns:
+        numpy.ndarray: the score of each document
+    """
+    if not documents:
+        return np.zeros(0)
+
+    query_tokens = utils.tokenize(query.lower())
+    num_attrs = len(weights)
+    scores = np.zeros(len(documents))
+
+    for start in range(0, len(documents), config.BATCH_SIZE):
+        chunk = documents[start:start + config.BATCH_SIZE]
+        # (attributes x docs) similarity values
+        matches = np.array([
+            similarity_batch(query_tokens, [doc[a] for doc in chunk])
+            for a in range(num_attrs)
+        ])
+        best = matches.argmax(axis=0)
+        columns = np.arange(len(chunk))
+        scores[start:start + len(chunk)] = \
+            matches[best, columns] * np.array(weights)[best]
+
+    return scores
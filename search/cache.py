@@ -0,0 +1,200 @@
+"""
+Caches used by the search engine to avoid repeating work across searches.
+"""
+from collections import OrderedDict
+import time
+
+from search import config, utils
+
+
+def _get_version(obj):
+    """
+    Default version function for cached objects, returns
+    ``(obj.id, obj.updated_at)``.
+    """
+    return obj.id, obj.updated_at
+
+
+class TokenCache:
+    """
+    LRU cache of the tokenized attributes of the searched objects, so that
+    objects that did not change since the last search are not tokenized again.
+
+    Entries are keyed by the object key and are valid as long as the object
+    version does not change: with the default ``version`` function an
+    object is tokenized again only after being saved (that updates its
+    ``updated_at`` field).
+
+    Arguments:
+        maxsize (int): max number of objects kept in the cache, when full the
+            least recently used one is evicted. Defaults to
+            :any:`config.TOKEN_CACHE_SIZE`.
+        version (callable): function that given an object returns a
+            ``(key, version)`` tuple, defaults to ``(obj.id, obj.updated_at)``.
+
+    Attributes:
+        hits (int): number of lookups served from the cache
+        misses (int): number of lookups that required tokenizing the object
+
+    Example:
+        >>> cache = TokenCache()
+        >>> search.search('shoes', ['name'], Item.select(), tokenizer=cache.tokens)
+    """
+
+    def __init__(self, maxsize=None, version=_get_version):
+        self.maxsize = maxsize or config.TOKEN_CACHE_SIZE
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def tokens(self, obj, attributes):
+        """
+        Return the tokens list of each one of the given attributes of ``obj``,
+        as :func:`search.utils.tokenize_attributes` does.
+        """
+        key, version = self.version(obj)
+        entry = self._entries.get(key)
+
+        if entry is None or entry[0] != version:
+            entry = (version, {})
+            self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        cached = entry[1]
+        missing = [attr for attr in attributes if attr not in cached]
+        if missing:
+            self.misses += 1
+            cached.update(zip(missing, utils.tokenize_attributes(obj, missing)))
+        else:
+            self.hits += 1
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+        return [cached[attr] for attr in attributes]
+
+    def discard(self, key):
+        """Remove the entry with the given key, if present."""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all the entries and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: ``hits``, ``misses``, current ``size`` and ``maxsize`` of
+            the cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+
+class ResultCache:
+    """
+    TTL and LRU cache of search results, storing the keys of the matching
+    objects so that a repeated search can skip the scoring and only load them.
+
+    Each entry is stored with the catalog version it was computed on: a lookup
+    with a different version (the catalog changed in the meantime) or after
+    ``ttl`` seconds is a miss, and the entry is dropped.
+
+    Arguments:
+        maxsize (int): max number of results kept in the cache, when full the
+            least recently used one is evicted. Defaults to
+            :any:`config.RESULT_CACHE_SIZE`.
+        ttl (float): seconds a result stays valid, defaults to
+            :any:`config.RESULT_CACHE_TTL`.
+        clock (callable): function returning the current time in seconds.
+
+    Attributes:
+        hits (int): number of lookups served from the cache
+        misses (int): number of lookups of missing, expired or outdated results
+
+    Example:
+        >>> cache = ResultCache()
+        >>> key = cache.key('shoes', 10, ['name'], [1], 0.75)
+        >>> cache.set(key, version, [3, 5])
+        >>> cache.get(key, version)
+        [3, 5]
+    """
+
+    def __init__(self, maxsize=None, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize or config.RESULT_CACHE_SIZE
+        self.ttl = config.RESULT_CACHE_TTL if ttl is None else ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(query, limit, attributes, weights, threshold, *extra):
+        """
+        Return the cache key of a search. The query is normalized to its
+        tokens, as the search does, so that queries differing only by case,
+        punctuation or short words share the same entry. ``extra`` values
+        (that must be hashable) are appended to the key.
+        """
+        return (tuple(utils.tokenize(query.lower())), limit, tuple(attributes),
+                tuple(weights or ()), threshold) + extra
+
+    def get(self, key, version):
+        """
+        Return the result keys stored for ``key``, None if missing, expired or
+        computed on a catalog version other than ``version``.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        entry_version, expires, result = entry
+        if entry_version != version or self.clock() >= expires:
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(result)
+
+    def set(self, key, version, result):
+        """Store the result keys of a search on the given catalog version."""
+        self._entries[key] = (version, self.clock() + self.ttl, tuple(result))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return list(result)
+
+    def clear(self):
+        """Remove all the entries and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: ``hits``, ``misses``, current ``size`` and ``maxsize`` of
+            the cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
@@ -17,3 +17,62 @@ MIN_WORD_LENGTH = 3
 
 #: Regex that will be used to split a string into separate chunks
 STR_SPLIT_REGEX = r'\W+'
+
+#: length of the character n-grams used to find typo tolerant candidates
+NGRAM_SIZE = 3
+
+#: minimum n-gram similarity (Dice coefficient on the n-gram sets) for an
+#: indexed token to be considered a fuzzy candidate for a query token.
+NGRAM_MIN_SIMILARITY = 0.5
+
+#: default phonetic encoding of :class:`search.index.PhoneticIndex`, one of
+#: ``metaphone``, ``nysiis`` or ``soundex``.
+PHONETIC_ALGORITHM = 'metaphone'
+
+#: max Levenshtein distance of the tokens found through the BK-tree of the
+#: search index (see :class:`search.index.BKTree`) for a query token.
+EDIT_DISTANCE = 1
+
+#: number of completions precomputed in each node of the autocomplete
+#: :class:`search.trie.CompletionTrie`, max number of suggestions returned.
+SUGGEST_SIZE = 10
+
+#: number of documents scored together by the vectorized scoring of
+#: :mod:`search.batch`, bounds the memory used by the intermediate arrays.
+BATCH_SIZE = 2048
+
+#: max number of documents kept by each :class:`search.cache.TokenCache`
+TOKEN_CACHE_SIZE = 10000
+
+#: max number of token pairs kept in the memo table of
+#: :func:`search.utils.jaro_winkler`, shared by all the searches of a process.
+JW_CACHE_SIZE = 2 ** 16
+
+#: seconds between two checks of the search index and autocomplete trie of a
+#: process against the table (see :any:`BaseModel.search_index`), bounds how
+#: long changes made by other processes or by bulk queries can be missed.
+INDEX_REFRESH_INTERVAL = 5
+
+#: max number of search results kept by each :class:`search.cache.ResultCache`
+RESULT_CACHE_SIZE = 1000
+
+#: seconds a cached search result stays valid, bounds how long a result can
+#: miss changes that do not bump the catalog version (such as other processes).
+RESULT_CACHE_TTL = 60
+
+#: length of the tokens prefixes looked up by the database full-text filter
+#: (see :any:`BaseModel.search`), shorter prefixes match more misspellings.
+FULLTEXT_PREFIX_LENGTH = 3
+
+#: max number of rows returned by the database full-text filter, ranked by
+#: the database full-text relevance, that are then scored by the search engine.
+FULLTEXT_MAX_CANDIDATES = 300
+
+#: minimum number of objects of a dataset to score it on a process pool, when
+#: :func:`search.core.search` is called with ``processes``.
+PARALLEL_MIN_SIZE = 5000
+
+#: objects scored by each executor call of the asyncio search (see
+#: :mod:`search.aio`): the loop can cancel the search and stream partial
+#: results between two chunks.
+ASYNC_CHUNK_SIZE = 500
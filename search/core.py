@@ -3,9 +3,9 @@ Search API core module
 
 Contains the main functions to get match values and searching
 """
-import jellyfish as jf
+import heapq
 
-from search import utils, config
+from search import batch, config, parallel, utils
 
 
 def similarity(query, string):
@@ -28,13 +28,45 @@ def similarity(query, string):
     # split the two strings cleaning out some stuff
     query = utils.tokenize(query.lower())
     string = utils.tokenize(string.lower())
+    return similarity_tokens(query, string)
 
+
+def similarity_tokens(query, string):
+    """
+    Same as :func:`similarity`, on the already tokenized `query` and `string`
+    (see :func:`search.utils.tokenize`).
+
+    Arguments:
+        query (list): search query tokens
+        string (list): tokens of the string to test against
+
+    Returns:
+        float: normalized match value, 0 -> 1
+    """
     # if one of the two strings is falsy (no content, or was passed with items
     # short enough to be trimmed out), return 0 here to avoid ZeroDivisionError
     # later on while processing.
     if len(query) == 0 or len(string) == 0:
         return 0
 
+    # apply the word-distance factor to the best match of each token
+    _weights = (config.MATCH_WEIGHT, config.DIST_WEIGHT)
+    matches = [utils.weighted_average((m, d), _weights)
+               for _, _, m, d in _token_matches(query, string)]
+
+    # get the weighted mean for all the highest matches and apply the highest
+    # match value found as coefficient as multiplier, to add weights to more
+    # coherent matches.
+    mean_match = (sum(matches) / len(matches)) * max(matches)
+    return mean_match
+
+
+def _token_matches(query, string):
+    """
+    Return the ``(token, matched, jaro_winkler, positional)`` best match of
+    each token of the longest of the two token lists, with the token of the
+    shortest list that has the highest Jaro-Winkler value with it.
+    """
     shortest, longest = sorted((query, string), key=lambda x: len(x))
 
     # matrix of tuples for each segment of both query and string
@@ -43,32 +75,154 @@ def similarity(query, string):
     matches = {}
     for string1, string2 in matrix:
         # get the jaro winkler equality between the two strings
-        match = jf.jaro_winkler(string1, string2)
+        match = utils.jaro_winkler(string1, string2)
         # calculate the distance factor for the position of the segments
         # on their respective lists
         positional = utils.position_similarity(
             string1, string2, longest, shortest)
 
         # get them together and append to the matches dictionary
-        match = (match, positional)
-        matches.setdefault(string1, []).append(match)
+        matches.setdefault(string1, []).append((match, positional, string2))
 
-    # get the highest value for each list, the apply the word-distance factor
-    # the key takes the jaro winkler distance value to get the max value
-    matches = [max(m, key=lambda x: x[0]) for m in matches.values()]
-    _weights = (config.MATCH_WEIGHT, config.DIST_WEIGHT)
-    matches = [utils.weighted_average((m, d), _weights) for m, d in matches]
+    # get the highest value for each list, the key takes the jaro winkler
+    # distance value to get the max value
+    best = []
+    for token, candidates in matches.items():
+        match, positional, matched = max(candidates, key=lambda x: x[0])
+        best.append((token, matched, match, positional))
+    return best
 
-    # get the weighted mean for all the highest matches and apply the highest
-    # match value found as coefficient as multiplier, to add weights to more
-    # coherent matches.
-    mean_match = (sum(matches) / len(matches)) * max(matches)
-    return mean_match
+
+def explain_similarity(query, string):
+    """
+    Breakdown of :func:`similarity_tokens`: the similarity of the two token
+    lists, the mean Jaro-Winkler and positional values of the best matches,
+    that are averaged with :any:`config.MATCH_WEIGHT` and
+    :any:`config.DIST_WEIGHT`, and the best match of each token.
+
+    Returns:
+        dict: ``similarity``, ``jaro_winkler``, ``positional`` and
+        ``tokens``, a list of ``{token, match, jaro_winkler, positional}``.
+    """
+    if len(query) == 0 or len(string) == 0:
+        return {'similarity': 0, 'jaro_winkler': 0, 'positional': 0, 'tokens': []}
+
+    matches = _token_matches(query, string)
+    return {
+        'similarity': similarity_tokens(query, string),
+        'jaro_winkler': sum(m[2] for m in matches) / len(matches),
+        'positional': sum(m[3] for m in matches) / len(matches),
+        'tokens': [{'token': token, 'match': matched, 'jaro_winkler': jw,
+                    'positional': positional}
+                   for token, matched, jw, positional in matches],
+    }
+
+
+def _score(query, document, attributes, weights, floor=None, threshold=0):
+    """
+    Return the match value of a tokenized document for the query tokens: the
+    highest similarity among the attributes, multiplied by the weight of that
+    attribute.
+
+    Attributes are scored from the highest weight down, and the scoring stops
+    returning None as soon as the match value cannot be higher than ``floor``
+    (if given) or reach ``threshold`` anymore: similarity is at most 1, so the
+    match can't be higher than the current one or the highest weight left.
+    """
+    order = sorted(range(len(attributes)),
+                   key=lambda i: weights[attributes[i]], reverse=True)
+    best, best_idx = -1, None
+
+    for i in order:
+        weight = weights[attributes[i]]
+        current = best * weights[attributes[best_idx]] if best_idx is not None else 0
+        upper_bound = max(current, weight)
+        if upper_bound < threshold or (floor is not None and upper_bound <= floor):
+            return None
+
+        match = similarity_tokens(query, document[i])
+        # on equal similarity the first attribute wins, as in the given order
+        if match > best or (match == best and i < best_idx):
+            best, best_idx = match, i
+
+    return best * weights[attributes[best_idx]]
+
+
+def explain_score(query, document, attributes, weights):
+    """
+    Breakdown of the match value computed by :func:`_score` for a tokenized
+    document: the :func:`explain_similarity` and weight of each attribute and
+    the ``attribute`` with the highest similarity, whose weight multiplies
+    the ``match``.
+    """
+    breakdown = {}
+    for attr, tokens in zip(attributes, document):
+        breakdown[attr] = explain_similarity(query, tokens)
+        breakdown[attr]['weight'] = weights[attr]
+
+    # highest similarity, the first attribute wins on equal ones as in _score
+    best = max(range(len(attributes)),
+               key=lambda i: (breakdown[attributes[i]]['similarity'], -i))
+    attr = attributes[best]
+    return {
+        'match': breakdown[attr]['similarity'] * weights[attr],
+        'attribute': attr,
+        'attributes': breakdown,
+    }
+
+
+class _TopK:
+    """
+    Bounded selection of the ``limit`` objects with the highest match, kept in
+    a min-heap. On equal match the object that came first wins, as a stable
+    sort of all the matches would do.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.heap = []
+        self.count = 0
+
+    @property
+    def floor(self):
+        """Match to beat to enter the selection, None if not full yet."""
+        if len(self.heap) < self.limit:
+            return None
+        return self.heap[0][0]
+
+    def push(self, obj, match):
+        self.count += 1
+        entry = (match, -self.count, obj)
+        if len(self.heap) < self.limit:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+
+    def results(self):
+        """Selected objects, from the highest match down."""
+        return [obj for _, _, obj in sorted(
+            self.heap, key=lambda e: e[:2], reverse=True)]
+
+
+def _attribute_weights(attributes, weights):
+    """
+    Return the ``{attribute: weight}`` scaled weights of the attributes,
+    generated from the attributes order if ``weights`` are missing or do not
+    match the attributes.
+    """
+    if not weights or len(weights) != len(attributes):
+        # list of integers of the same length of `attributes` as in [3, 2, 1]
+        # for attributes = ['a', 'b', 'c']
+        weights = list(range(len(attributes), 0, -1))
+
+    weights = utils.scale_to_one(weights)
+    return {attr: w for attr, w in zip(attributes, weights)}
 
 
 def search(
         query, attributes, dataset, limit=-1,
-        threshold=config.THRESHOLD, weights=None):
+        threshold=config.THRESHOLD, weights=None, index=None,
+        vectorized=False, tokenizer=None, processes=None, explain=None):
     """
     Main function of the package, allows to do a fuzzy full-text search on the
     rows of the given `table` model, looking up the value
@@ -82,12 +236,34 @@ def search(
         dataset (iterable): iterable of `objects` to lookup. All the objects
             in the dataset **must** have the specified attribute(s)
         limit (int): max number of results to return. if ``-1`` will return
-            everything.
+            everything. With a positive limit only the best ``limit`` matches
+            are kept (in a heap) while scoring, and the scoring of an object
+            stops as soon as it can't be one of them.
         threshold (float): value under which results are considered not valid.
         weights (list): matching `attributes` argument, describes the
             attributes weights. if not provided **or** if different length
             the weight will generated automatically, considering
             the index of the attribute name, reversed (first -> more weight).
+        index (search.index.InvertedIndex): optional index over the dataset
+            objects, used as pre-filter: objects that are not candidates for
+            the query are skipped without being scored.
+        vectorized (bool): if True the dataset is tokenized and scored in
+            batch with NumPy (see :mod:`search.batch`), scores match the
+            default path within float tolerance.
+        tokenizer (callable): function that given an object and the list of
+            attributes returns the tokens list of each attribute, such as
+            :meth:`search.cache.TokenCache.tokens`. Defaults to
+            :func:`search.utils.tokenize_attributes`.
+        processes (int): if given, datasets of at least
+            :any:`config.PARALLEL_MIN_SIZE` objects are split in shards scored
+            by a pool of ``processes`` worker processes (see
+            :mod:`search.parallel`). Smaller datasets are scored in the
+            calling process, as the IPC would cost more than the scoring.
+        explain (search.explain.Explanation): if given, it is filled in with
+            the timings of the search stages and the breakdown of the match
+            of each result. The dataset is then scored in the calling process
+            on the default path (``vectorized`` and ``processes`` are
+            ignored), with the same results.
 
     Returns:
         list: A list containing ``[0:limit]`` resources from the given table,
@@ -116,37 +292,256 @@ def search(
         Will have the same effect
     """
     matches = []
-    if not weights or len(weights) != len(attributes):
-        # list of integers of the same length of `attributes` as in [3, 2, 1]
-        # for attributes = ['a', 'b', 'c']
-        weights = list(range(len(attributes), 0, -1))
-
-    weights = utils.scale_to_one(weights)
-    weights = {attr: w for attr, w in zip(attributes, weights)}
+    weights = _attribute_weights(attributes, weights)
 
     if not threshold:
         threshold = 0
 
-    for obj in dataset:
-        partial_matches = []
-
-        for attr in attributes:
-            attrval = getattr(obj, attr)
-
-            match = similarity(query, attrval)
-            partial_matches.append({'attr': attr, 'match': match})
+    tokenize = tokenizer or utils.tokenize_attributes
+
+    if explain is not None:
+        return _search_explain(query, attributes, dataset, limit, threshold,
+                               weights, index, tokenize, explain)
+
+    if index is not None:
+        candidates = index.candidates(query)
+        dataset = (obj for obj in dataset if index.key(obj) in candidates)
+
+    if processes:
+        dataset = list(dataset)
+        if len(dataset) >= config.PARALLEL_MIN_SIZE:
+            return _search_parallel(
+                query, attributes, dataset, limit, threshold, weights,
+                tokenize, vectorized, processes)
+
+    if vectorized:
+        dataset = list(dataset)
+        scores = batch.score_batch(
+            query, [tokenize(obj, attributes) for obj in dataset],
+            [weights[attr] for attr in attributes])
+        scored = zip(dataset, scores.tolist())
+    elif limit > 0:
+        return _search_top_k(
+            utils.tokenize(query.lower()), attributes, dataset, limit,
+            threshold, weights, tokenize)
+    else:
+        query_tokens = utils.tokenize(query.lower())
+        scored = ((obj, _score(query_tokens, tokenize(obj, attributes),
+                               attributes, weights))
+                  for obj in dataset)
 
-        # get the highest match for each attribute and multiply it by the
-        # attribute weight, so we can get the weighted average to return
-        match = max(partial_matches, key=lambda m: m['match'])
-        match = match['match'] * weights[match['attr']]
+    if limit > 0:
+        top = _TopK(limit)
+        for obj, match in scored:
+            if match >= threshold:
+                top.push(obj, match)
+        return top.results()
 
+    for obj, match in scored:
         if match >= threshold:
             matches.append({'data': obj, 'match': match})
 
     matches.sort(key=lambda m: m['match'], reverse=True)
 
+    return [m['data'] for m in matches]
+
+
+def _search_explain(query, attributes, dataset, limit, threshold, weights,
+                    index, tokenize, explain):
+    """
+    Search filling in the ``explain`` :class:`search.explain.Explanation`,
+    running each stage on the whole dataset in turn to time it. The scoring
+    is the one of the default path (with the same top-k pruning when there is
+    a limit), the breakdown is computed afterwards for the results only.
+    """
+    explain.weights = weights
+
+    if index is not None:
+        with explain.timer('candidates'):
+            candidates = index.candidates(query)
+        dataset = (obj for obj in dataset if index.key(obj) in candidates)
+
+    with explain.timer('load'):
+        dataset = list(dataset)
+
+    with explain.timer('tokenize'):
+        explain.query = utils.tokenize(query.lower())
+        documents = [tokenize(obj, attributes) for obj in dataset]
+
+    if limit > 0:
+        with explain.timer('scoring'):
+            top = _TopK(limit)
+            for obj, document in zip(dataset, documents):
+                match = _score(explain.query, document, attributes, weights,
+                               top.floor, threshold)
+                if match is not None and match >= threshold:
+                    top.push((obj, document), match)
+
+        with explain.timer('sort'):
+            matches = top.results()
+        count = top.count
+    else:
+        with explain.timer('scoring'):
+            scores = [_score(explain.query, document, attributes, weights)
+                      for document in documents]
+
+        with explain.timer('sort'):
+            # stable sort: on equal match the first object wins, as in _TopK
+            matches = sorted(
+                (m for m in zip(zip(dataset, documents), scores) if m[1] >= threshold),
+                key=lambda m: m[1], reverse=True)
+            matches = [match for match, _ in matches]
+        count = len(matches)
+
+    explain.counts = {'scored': len(dataset), 'matches': count}
+    explain.results = [explain_score(explain.query, document, attributes, weights)
+                       for _, document in matches]
+    return [obj for obj, _ in matches]
+
+
+def _search_top_k(query, attributes, dataset, limit, threshold, weights, tokenize):
+    """
+    Score the dataset keeping only the best ``limit`` objects, skipping the
+    remaining attributes of an object as soon as it can't enter the selection.
+    Memory depends on ``limit`` and not on the number of matches.
+    """
+    top = _TopK(limit)
+
+    for obj in dataset:
+        match = _score(query, tokenize(obj, attributes), attributes, weights,
+                       top.floor, threshold)
+        if match is not None and match >= threshold:
+            top.push(obj, match)
+
+    return top.results()
+
+
+def _search_parallel(query, attributes, dataset, limit, threshold, weights,
+                     tokenize, vectorized, processes):
+    """
+    Score the dataset in shards on the process pool and merge the per-shard
+    selections. Tokens are sent to the workers in place of the objects, that
+    are picked back from the dataset by their position.
+    """
+    documents = [tokenize(obj, attributes) for obj in dataset]
+    shards = parallel.map_shards(
+        _score_shard, documents, processes,
+        query, attributes, weights, limit, threshold, vectorized)
+
+    # sorting on the position too keeps the first object on equal match, as
+    # the stable sort on the whole dataset does.
+    matches = sorted((m for shard in shards for m in shard),
+                     key=lambda m: (-m[0], m[1]))
     if limit > 0:
         matches = matches[:limit]
+    return [dataset[position] for _, position in matches]
 
-    return [m['data'] for m in matches]
+
+def _score_shard(offset, documents, query, attributes, weights, limit,
+                 threshold, vectorized):
+    """
+    Worker of :func:`_search_parallel`: score a shard of tokenized documents
+    and return the ``(match, position)`` pairs of the ones over ``threshold``,
+    only the best ``limit`` of them if ``limit`` is positive.
+    """
+    query_tokens = utils.tokenize(query.lower())
+    top = _TopK(limit) if limit > 0 else None
+    if vectorized:
+        scores = batch.score_batch(
+            query, documents, [weights[attr] for attr in attributes]).tolist()
+    else:
+        scores = None
+
+    matches = []
+    for i, document in enumerate(documents):
+        if scores is not None:
+            match = scores[i]
+        else:
+            floor = top.floor if top is not None else None
+            match = _score(query_tokens, document, attributes, weights,
+                           floor, threshold)
+        if match is None or match < threshold:
+            continue
+        if top is not None:
+            top.push((match, offset + i), match)
+        else:
+            matches.append((match, offset + i))
+
+    return top.results() if top is not None else matches
+
+
+def search_many(queries, attributes, dataset, threshold=config.THRESHOLD,
+                index=None, tokenizer=None):
+    """
+    Run several searches on the same dataset in a single pass: each object is
+    tokenized once and scored against every query, and the Jaro-Winkler
+    values of the token pairs are shared through the memo table of
+    :func:`search.utils.jaro_winkler`. Results are the same of a
+    :func:`search` call for each query.
+
+    Arguments:
+        queries (list): the searches to run, as dicts with the ``query``
+            string and the optional ``limit`` (default ``-1``) and ``weights``
+            of each one, see :func:`search`.
+        attributes (list): names of the attributes to search into.
+        dataset (iterable): objects to lookup.
+        threshold (float): value under which results are considered not valid.
+        index (search.index.InvertedIndex): optional index over the dataset
+            objects, each object is scored only against the queries it is a
+            candidate for.
+        tokenizer (callable): tokenizer of the objects attributes, see
+            :func:`search`.
+
+    Returns:
+        list: the list of results of each query, in the same order.
+
+    Example:
+        >>> search_many([{'query': 'sedie', 'limit': 5},
+        ...              {'query': 'tavolo', 'weights': [1, 3]}],
+        ...             ['name', 'category'], Item.select())
+        [[<Item name: 'sedie'>], [<Item name: 'tavolo'>]]
+    """
+    threshold = threshold or 0
+    tokenize = tokenizer or utils.tokenize_attributes
+
+    searches = []
+    for spec in queries:
+        limit = spec.get('limit', -1)
+        searches.append({
+            'tokens': utils.tokenize(spec['query'].lower()),
+            'weights': _attribute_weights(attributes, spec.get('weights')),
+            'candidates': index.candidates(spec['query']) if index is not None else None,
+            'top': _TopK(limit) if limit > 0 else None,
+            'matches': [],
+        })
+
+    if index is not None:
+        keys = set().union(*(s['candidates'] for s in searches))
+        dataset = (obj for obj in dataset if index.key(obj) in keys)
+
+    for obj in dataset:
+        document = tokenize(obj, attributes)
+        key = index.key(obj) if index is not None else None
+
+        for current in searches:
+            if current['candidates'] is not None and key not in current['candidates']:
+                continue
+
+            top = current['top']
+            match = _score(current['tokens'], document, attributes,
+                           current['weights'], top.floor if top else None, threshold)
+            if match is None or match < threshold:
+                continue
+            if top is not None:
+                top.push(obj, match)
+            else:
+                current['matches'].append((obj, match))
+
+    results = []
+    for current in searches:
+        if current['top'] is not None:
+            results.append(current['top'].results())
+        else:
+            matches = sorted(current['matches'], key=lambda m: m[1], reverse=True)
+            results.append([obj for obj, _ in matches])
+    return results
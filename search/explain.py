@@ -0,0 +1,58 @@
+"""
+Instrumentation of a single search: timings of its stages and breakdown of
+the match value of each result, see :class:`Explanation`.
+"""
+import time
+from contextlib import contextmanager
+
+
+class Explanation:
+    """
+    Breakdown of a search, filled in by :func:`search.core.search` (and
+    :any:`BaseModel.search`) when passed as their ``explain`` argument.
+
+    Attributes:
+        timings (dict): ``{stage: seconds}`` in the order the stages ran:
+            ``candidates`` (full-text and index pre-filters), ``load`` (rows
+            fetched from the dataset), ``tokenize``, ``scoring`` and ``sort``.
+        query (list): tokens of the query.
+        weights (dict): scaled ``{attribute: weight}`` used for the search.
+        counts (dict): number of objects ``scored`` and of ``matches`` over
+            the threshold. With a limit the objects pruned by the top-k
+            selection are not counted among the ``matches``.
+        results (list): breakdown of the match of each result, in the same
+            order of the results (see :func:`search.core.explain_score`).
+
+    Example:
+        >>> explanation = Explanation()
+        >>> results = search('divano', ['name'], Item.select(), 10, explain=explanation)
+        >>> explanation.timings
+        {'load': 0.0011, 'tokenize': 0.0004, 'scoring': 0.0021, 'sort': 0.0001}
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.query = []
+        self.weights = {}
+        self.counts = {}
+        self.results = []
+
+    @contextmanager
+    def timer(self, stage):
+        """Add the time spent in the ``with`` block to the ``stage`` timing."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[stage] = self.timings.get(stage, 0) + elapsed
+
+    def json(self):
+        """Return the explanation as a JSON serializable dict."""
+        return {
+            'timings_ms': {stage: round(t * 1000, 3) for stage, t in self.timings.items()},
+            'query': self.query,
+            'weights': self.weights,
+            'counts': self.counts,
+            'results': self.results,
+        }
@@ -0,0 +1,397 @@
+"""
+In-memory indexes used by the search engine to narrow down the resources to
+score before running the fuzzy matching of :func:`search.core.similarity`.
+"""
+import jellyfish
+
+from search import config, utils
+
+
+def _get_id(obj):
+    """Default key function for indexed objects, returns ``obj.id``."""
+    return obj.id
+
+
+class NGramIndex:
+    """
+    Character n-gram index over a vocabulary of tokens, used to find the
+    tokens similar to a (possibly misspelled) query token, such as
+    ``sneakr -> sneaker``, without comparing it against the whole vocabulary.
+
+    Similarity is the Dice coefficient between the n-gram sets of the two
+    tokens, and only the tokens sharing at least one n-gram with the query are
+    ever considered, so the cost depends on the size of the postings of the
+    query n-grams rather than on the size of the vocabulary.
+
+    Arguments:
+        size (int): n-gram length, defaults to :any:`config.NGRAM_SIZE`
+
+    Attributes:
+        postings (dict): ``{ngram: set(tokens)}``
+    """
+
+    def __init__(self, size=None):
+        self.size = size or config.NGRAM_SIZE
+        self.postings = {}
+        self._lengths = {}
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, token):
+        return token in self._lengths
+
+    def add(self, token):
+        """Add a token to the vocabulary."""
+        if token in self._lengths:
+            return
+        grams = utils.ngrams(token, self.size)
+        self._lengths[token] = len(grams)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(token)
+
+    def remove(self, token):
+        """Remove a token from the vocabulary. Missing tokens are ignored."""
+        if self._lengths.pop(token, None) is None:
+            return
+        for gram in utils.ngrams(token, self.size):
+            tokens = self.postings[gram]
+            tokens.discard(token)
+            if not tokens:
+                del self.postings[gram]
+
+    def similar(self, token, min_similarity=None):
+        """
+        Return the vocabulary tokens whose n-gram similarity with ``token`` is
+        at least ``min_similarity``.
+
+        Arguments:
+            token (str): normalized token to look up
+            min_similarity (float): value between 0 and 1, defaults to
+                :any:`config.NGRAM_MIN_SIMILARITY`
+
+        Returns:
+            set: matching tokens from the vocabulary.
+        """
+        if min_similarity is None:
+            min_similarity = config.NGRAM_MIN_SIMILARITY
+
+        grams = utils.ngrams(token, self.size)
+        shared = {}
+        for gram in grams:
+            for candidate in self.postings.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        return {
+            candidate for candidate, count in shared.items()
+            if 2.0 * count / (len(grams) + self._lengths[candidate]) >= min_similarity
+        }
+
+
+class PhoneticIndex:
+    """
+    Phonetic key index over a vocabulary of tokens, used to find the tokens
+    that sound like a (possibly misspelled) query token, such as
+    ``skarpe -> scarpe``, with a single dictionary lookup.
+
+    Arguments:
+        algorithm (str): name of the jellyfish phonetic encoding, one of
+            :attr:`ALGORITHMS`. Defaults to :any:`config.PHONETIC_ALGORITHM`.
+
+    Attributes:
+        postings (dict): ``{phonetic key: set(tokens)}``
+
+    Raises:
+        ValueError: if the algorithm is not supported.
+    """
+
+    #: supported phonetic encodings
+    ALGORITHMS = {
+        'metaphone': jellyfish.metaphone,
+        'nysiis': jellyfish.nysiis,
+        'soundex': jellyfish.soundex,
+    }
+
+    def __init__(self, algorithm=None):
+        self.algorithm = algorithm or config.PHONETIC_ALGORITHM
+        if self.algorithm not in self.ALGORITHMS:
+            raise ValueError('Unsupported phonetic algorithm: {}'.format(
+                self.algorithm))
+        self.encode = self.ALGORITHMS[self.algorithm]
+        self.postings = {}
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, token):
+        return token in self._keys
+
+    def add(self, token):
+        """Add a token to the vocabulary. Tokens without a key are ignored."""
+        if token in self._keys:
+            return
+        key = self.encode(token)
+        if not key:
+            return
+        self._keys[token] = key
+        self.postings.setdefault(key, set()).add(token)
+
+    def remove(self, token):
+        """Remove a token from the vocabulary. Missing tokens are ignored."""
+        key = self._keys.pop(token, None)
+        if key is None:
+            return
+        tokens = self.postings[key]
+        tokens.discard(token)
+        if not tokens:
+            del self.postings[key]
+
+    def similar(self, token):
+        """
+        Return the vocabulary tokens with the same phonetic key of ``token``.
+
+        Returns:
+            set: matching tokens from the vocabulary.
+        """
+        key = self.encode(token)
+        return set(self.postings.get(key, ())) if key else set()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over a vocabulary of tokens, finding all the tokens
+    within a given edit distance of a (possibly misspelled) query token, such
+    as ``tavlo -> tavolo``, without comparing it against the whole vocabulary.
+
+    Each child of a node is stored under its distance from the node, and by
+    the triangle inequality only the children within ``max_distance`` of the
+    query distance from the node need to be visited.
+
+    Removed tokens are only marked as such, as the nodes below them still
+    need them to be reached, so the tree does not shrink until rebuilt.
+
+    Arguments:
+        distance (callable): metric between two tokens, defaults to
+            the Levenshtein distance.
+
+    Attributes:
+        root (list): ``[token, {distance: child}]`` root node, None if empty.
+    """
+
+    def __init__(self, distance=None):
+        self.distance = distance or jellyfish.levenshtein_distance
+        self.root = None
+        self._nodes = set()
+        self._tokens = set()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __contains__(self, token):
+        return token in self._tokens
+
+    def add(self, token):
+        """Add a token to the vocabulary."""
+        self._tokens.add(token)
+        if token in self._nodes:
+            return
+        self._nodes.add(token)
+
+        if self.root is None:
+            self.root = [token, {}]
+            return
+        node = self.root
+        while True:
+            distance = self.distance(token, node[0])
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [token, {}]
+                return
+            node = child
+
+    def remove(self, token):
+        """Remove a token from the vocabulary. Missing tokens are ignored."""
+        self._tokens.discard(token)
+
+    def search(self, token, max_distance):
+        """
+        Return the vocabulary tokens within ``max_distance`` of ``token``.
+
+        Returns:
+            set: matching tokens from the vocabulary.
+        """
+        matches = set()
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node_token, children = nodes.pop()
+            distance = self.distance(token, node_token)
+            if distance <= max_distance and node_token in self._tokens:
+                matches.add(node_token)
+            for child_distance, child in children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    nodes.append(child)
+        return matches
+
+
+class InvertedIndex:
+    """
+    Inverted index mapping each normalized token of the indexed attributes
+    to the keys of the objects containing it.
+
+    Tokens are normalized the same way :func:`search.core.similarity` does,
+    using :func:`search.utils.tokenize` on the lowercased attribute value, so
+    that every object sharing at least one token with the query is returned as
+    candidate.
+
+    Query tokens are also looked up in a :class:`NGramIndex` over the indexed
+    tokens, so that objects containing a token similar to a misspelled query
+    token are returned as well, and optionally in a :class:`PhoneticIndex` for
+    the tokens that sound alike and in a :class:`BKTree` for the tokens within
+    a given edit distance.
+
+    Arguments:
+        attributes (list): names of the attributes to index for each object
+        key (callable): function that given an object returns its unique key,
+            defaults to ``obj.id``.
+        phonetic (str): phonetic algorithm of the :class:`PhoneticIndex` over
+            the indexed tokens, no phonetic lookup if None.
+        edit_distance (int): max edit distance of the tokens found through
+            the :class:`BKTree` over the indexed tokens, no lookup if None.
+
+    Attributes:
+        postings (dict): ``{token: set(keys)}`` for each indexed token.
+        documents (dict): ``{key: set(tokens)}`` reverse lookup used to update
+            and remove objects from the index.
+        ngrams (NGramIndex): n-gram index over the ``postings`` tokens.
+        phonetic (PhoneticIndex): phonetic index over the ``postings`` tokens,
+            None if disabled.
+        bktree (BKTree): BK-tree over the ``postings`` tokens, None if
+            disabled.
+
+    Example:
+        >>> index = InvertedIndex(['name'])
+        >>> index.build(Item.select())
+        >>> index.candidates('red shoes')
+        {1, 5, 12}
+    """
+
+    def __init__(self, attributes, key=_get_id, phonetic=None, edit_distance=None):
+        self.attributes = list(attributes)
+        self.key = key
+        self.postings = {}
+        self.documents = {}
+        self.ngrams = NGramIndex()
+        self.phonetic = PhoneticIndex(phonetic) if phonetic else None
+        self.edit_distance = edit_distance
+        self.bktree = BKTree() if edit_distance is not None else None
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, key):
+        return key in self.documents
+
+    def tokens(self, obj):
+        """Return the set of normalized tokens for all the indexed attributes."""
+        return utils.tokens_set(obj, self.attributes)
+
+    def build(self, dataset):
+        """
+        Clear the index and add every object of the given dataset.
+
+        Arguments:
+            dataset (iterable): objects to index.
+
+        Returns:
+            InvertedIndex: the callee index.
+        """
+        self.postings = {}
+        self.documents = {}
+        self.ngrams = NGramIndex(self.ngrams.size)
+        if self.phonetic is not None:
+            self.phonetic = PhoneticIndex(self.phonetic.algorithm)
+        if self.bktree is not None:
+            self.bktree = BKTree(self.bktree.distance)
+        for obj in dataset:
+            self.add(obj)
+        return self
+
+    def add(self, obj):
+        """
+        Add an object to the index, replacing the previous entry with the same
+        key if any.
+        """
+        key = self.key(obj)
+        self.remove(key)
+
+        tokens = self.tokens(obj)
+        self.documents[key] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                self.ngrams.add(token)
+                if self.phonetic is not None:
+                    self.phonetic.add(token)
+                if self.bktree is not None:
+                    self.bktree.add(token)
+            self.postings[token].add(key)
+
+    def remove(self, key):
+        """
+        Remove the object with the given key from the index. Missing keys are
+        ignored.
+        """
+        tokens = self.documents.pop(key, ())
+        for token in tokens:
+            keys = self.postings[token]
+            keys.discard(key)
+            if not keys:
+                del self.postings[token]
+                self.ngrams.remove(token)
+                if self.phonetic is not None:
+                    self.phonetic.remove(token)
+                if self.bktree is not None:
+                    self.bktree.remove(token)
+
+    def query_tokens(self, query):
+        """Return the normalized tokens of the query string."""
+        return set(utils.tokenize(query.lower()))
+
+    def expand(self, token, fuzzy=True):
+        """
+        Return the indexed tokens matching the given query token: the token
+        itself if indexed, plus the similar ones found through the n-gram
+        index, the ones sounding alike found through the phonetic index and
+        the ones within the edit distance found through the BK-tree (if
+        enabled) if ``fuzzy``.
+        """
+        tokens = {token} if token in self.postings else set()
+        if fuzzy:
+            tokens.update(self.ngrams.similar(token))
+            if self.phonetic is not None:
+                tokens.update(self.phonetic.similar(token))
+            if self.bktree is not None:
+                tokens.update(self.bktree.search(token, self.edit_distance))
+        return tokens
+
+    def candidates(self, query, fuzzy=True):
+        """
+        Return the keys of all the objects that share at least a token with the
+        given query. The cost depends on the number of postings matching the
+        query tokens, not on the number of indexed objects.
+
+        Arguments:
+            query (str): search query
+            fuzzy (bool): if True also return objects containing tokens
+                similar to the query ones (see :class:`NGramIndex`,
+                :class:`PhoneticIndex` and :class:`BKTree`)
+
+        Returns:
+            set: keys of the candidate objects.
+        """
+        keys = set()
+        for token in self.query_tokens(query):
+            for match in self.expand(token, fuzzy):
+                keys.update(self.postings[match])
+        return keys
@@ -0,0 +1,63 @@
+"""
+Process pool support for the search engine.
+
+Scoring is pure python CPU work that holds the GIL, so a large dataset can be
+split in shards scored by separate processes (see the ``processes`` argument
+of :func:`search.core.search`). The pools are created on first use and reused
+by the following searches of the process.
+
+Workers never receive the dataset objects (such as model instances): each
+shard is sent as a compact tuple with its offset in the dataset and the tokens
+of each document, the workers return the ``(match, position)`` pairs of their
+best matches.
+"""
+import concurrent.futures
+import os
+
+
+_executors = {}
+
+
+def executor(processes=None):
+    """
+    Return the shared :class:`concurrent.futures.ProcessPoolExecutor` with
+    ``processes`` workers (default: the number of CPUs), creating it on the
+    first call.
+    """
+    processes = processes or os.cpu_count() or 1
+    if processes not in _executors:
+        _executors[processes] = concurrent.futures.ProcessPoolExecutor(processes)
+    return _executors[processes]
+
+
+def shutdown():
+    """Shut down all the pools created by :func:`executor`."""
+    while _executors:
+        _, pool = _executors.popitem()
+        pool.shutdown()
+
+
+def shards(documents, count):
+    """
+    Split ``documents`` in ``count`` contiguous shards of (almost) the same
+    size.
+
+    Returns:
+        list: ``(offset, documents)`` tuples, where ``offset`` is the index of
+        the first document of the shard in ``documents``.
+    """
+    size = -(-len(documents) // max(count, 1))
+    return [(start, documents[start:start + size])
+            for start in range(0, len(documents), max(size, 1))]
+
+
+def map_shards(function, documents, processes, *args):
+    """
+    Call ``function(offset, shard, *args)`` on each shard of ``documents`` in
+    the ``processes`` pool and return the results, in the shards order.
+    ``function`` and ``args`` must be picklable.
+    """
+    pool = executor(processes)
+    futures = [pool.submit(function, offset, shard, *args)
+               for offset, shard in shards(documents, processes)]
+    return [future.result() for future in futures]
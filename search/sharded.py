@@ -0,0 +1,309 @@
+"""
+Search index partitioned in shards served by separate processes.
+
+Each shard process keeps the :class:`search.InvertedIndex` and the tokens of
+the objects whose key hashes to it (see :func:`shard_of`), and scores them
+with the same code of :func:`search.core.search`. A :class:`ShardedIndex`
+coordinator sends each search to all the shards at once over a
+:mod:`multiprocessing.connection` channel, so that they score in parallel,
+and merges their best matches.
+
+Shards can run on the same host (:meth:`ShardedIndex.local`) or on other ones
+(:func:`serve`, see ``scripts/search_shard.py``), and only the coordinator
+needs to know the objects keys: the shards never receive the objects but the
+values of the indexed attributes.
+"""
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+import zlib
+from multiprocessing.connection import Client, Listener
+from types import SimpleNamespace
+
+from search import config, core, utils
+from search.index import InvertedIndex, _get_id
+
+
+#: commands that a shard process accepts from the coordinator
+COMMANDS = frozenset(['clear', 'add', 'add_many', 'remove', 'search',
+                      'candidates', 'size'])
+
+
+def shard_of(key, count):
+    """
+    Return the shard (``0 <= shard < count``) of the given key, from a hash
+    of its string value that does not change across processes and hosts.
+    """
+    return zlib.crc32(str(key).encode()) % count
+
+
+class _Shard:
+    """Index and tokenized documents of the objects of a shard."""
+
+    def __init__(self, attributes, phonetic=None, edit_distance=None):
+        self.attributes = list(attributes)
+        self.phonetic = phonetic
+        self.edit_distance = edit_distance
+        self.clear()
+
+    def clear(self):
+        self.index = InvertedIndex(self.attributes, phonetic=self.phonetic,
+                                   edit_distance=self.edit_distance)
+        self.documents = {}
+
+    def add(self, key, values):
+        obj = SimpleNamespace(id=key, **dict(zip(self.attributes, values)))
+        self.index.add(obj)
+        self.documents[key] = utils.tokenize_attributes(obj, self.attributes)
+
+    def add_many(self, entries):
+        for key, values in entries:
+            self.add(key, values)
+
+    def remove(self, key):
+        self.index.remove(key)
+        self.documents.pop(key, None)
+
+    def candidates(self, query):
+        return self.index.candidates(query)
+
+    def size(self):
+        return len(self.documents)
+
+    def search(self, query, limit, threshold, weights, use_index):
+        """
+        Return the ``(match, key)`` pairs of the best matches of the shard,
+        sorted from the highest match and on equal match by key.
+        """
+        if use_index:
+            keys = sorted(self.index.candidates(query))
+        else:
+            keys = sorted(self.documents)
+
+        # on equal match the first document wins, that is the lowest key
+        matches = core._score_shard(
+            0, [self.documents[key] for key in keys], query, self.attributes,
+            weights, limit, threshold, False)
+        return sorted(((match, keys[position]) for match, position in matches),
+                      key=lambda m: (-m[0], m[1]))
+
+
+def serve(address, authkey, attributes, phonetic=None, edit_distance=None,
+          ready=None):
+    """
+    Serve a shard: listen on ``address`` (any address accepted by
+    :class:`multiprocessing.connection.Listener`, ``None`` for a new local
+    one) and run the commands of a coordinator until it closes the shard.
+
+    Arguments:
+        address: address to listen on.
+        authkey (bytes): key shared with the coordinator.
+        attributes (list): names of the indexed attributes.
+        phonetic (str): phonetic algorithm of the index, see
+            :class:`search.InvertedIndex`.
+        edit_distance (int): max edit distance of the index, see
+            :class:`search.InvertedIndex`.
+        ready (multiprocessing.connection.Connection): if given the listening
+            address is sent on it, once the shard accepts connections.
+    """
+    shard = _Shard(attributes, phonetic, edit_distance)
+    with Listener(address, authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+
+        with listener.accept() as conn:
+            while True:
+                try:
+                    command, *args = conn.recv()
+                except EOFError:
+                    return
+
+                if command == 'close':
+                    conn.send(('ok', None))
+                    return
+                try:
+                    if command not in COMMANDS:
+                        raise ValueError('Unknown shard command {!r}'.format(command))
+                    conn.send(('ok', getattr(shard, command)(*args)))
+                except Exception as exc:
+                    conn.send(('error', exc))
+
+
+class ShardedIndex:
+    """
+    Coordinator of a search index partitioned in shards by key hash, each one
+    served by a shard process (see :func:`serve`).
+
+    Searches are sent to all the shards before waiting for any of them, so
+    that the shards score their objects in parallel, then the best matches of
+    each shard are merged. Results are the same of :func:`search.core.search`
+    on the objects sorted by key (on equal match the lowest key wins).
+
+    Arguments:
+        attributes (list): names of the attributes to index for each object
+        addresses (list): addresses of the shard processes, one per shard.
+        authkey (bytes): key shared with the shard processes.
+        key (callable): function that given an object returns its unique key,
+            defaults to ``obj.id``.
+
+    Example:
+        >>> with ShardedIndex.local(['name', 'description'], 4) as index:
+        ...     index.build(Item.select())
+        ...     index.search('divano', limit=10)
+        [(12, 0.94), (3, 0.87)]
+    """
+
+    def __init__(self, attributes, addresses, authkey, key=_get_id):
+        self.attributes = list(attributes)
+        self.key = key
+        self.connections = [Client(address, authkey=authkey) for address in addresses]
+        self.processes = []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def local(cls, attributes, shards, key=_get_id, phonetic=None,
+              edit_distance=None):
+        """
+        Start ``shards`` shard processes on this host, listening on local
+        sockets, and return their coordinator. :meth:`close` stops them.
+        """
+        authkey = os.urandom(16)
+        processes, addresses = [], []
+        for _ in range(shards):
+            reader, writer = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=serve, daemon=True,
+                args=(None, authkey, attributes, phonetic, edit_distance, writer))
+            process.start()
+            writer.close()
+            processes.append(process)
+            addresses.append(reader.recv())
+            reader.close()
+
+        index = cls(attributes, addresses, authkey, key)
+        index.processes = processes
+        return index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return sum(self._scatter('size'))
+
+    def shard(self, key):
+        """Return the shard of the given key, see :func:`shard_of`."""
+        return shard_of(key, len(self.connections))
+
+    def _values(self, obj):
+        return tuple(getattr(obj, attr) for attr in self.attributes)
+
+    def _scatter(self, command, *args):
+        """Send a command to all the shards, then gather their results."""
+        with self.lock:
+            for conn in self.connections:
+                conn.send((command,) + args)
+            return [self._result(conn) for conn in self.connections]
+
+    def _call(self, shard, command, *args):
+        """Send a command to a shard and return its result."""
+        with self.lock:
+            conn = self.connections[shard]
+            conn.send((command,) + args)
+            return self._result(conn)
+
+    @staticmethod
+    def _result(conn):
+        status, value = conn.recv()
+        if status == 'error':
+            raise value
+        return value
+
+    def build(self, dataset):
+        """
+        Clear the shards and add every object of the given dataset, sent to
+        the shards in batches of :any:`config.BATCH_SIZE`.
+
+        Returns:
+            ShardedIndex: the callee index.
+        """
+        self._scatter('clear')
+        batches = [[] for _ in self.connections]
+        for obj in dataset:
+            key = self.key(obj)
+            shard = self.shard(key)
+            batches[shard].append((key, self._values(obj)))
+            if len(batches[shard]) >= config.BATCH_SIZE:
+                self._call(shard, 'add_many', batches[shard])
+                batches[shard] = []
+
+        for shard, batch in enumerate(batches):
+            if batch:
+                self._call(shard, 'add_many', batch)
+        return self
+
+    def add(self, obj):
+        """
+        Add an object to its shard, replacing the previous entry with the same
+        key if any.
+        """
+        key = self.key(obj)
+        self._call(self.shard(key), 'add', key, self._values(obj))
+
+    def remove(self, key):
+        """Remove the object with the given key. Missing keys are ignored."""
+        self._call(self.shard(key), 'remove', key)
+
+    def candidates(self, query):
+        """
+        Return the set of keys of the objects sharing a token with the query,
+        see :meth:`search.InvertedIndex.candidates`.
+        """
+        return set().union(*self._scatter('candidates', query))
+
+    def search(self, query, limit=-1, threshold=config.THRESHOLD, weights=None,
+               use_index=True):
+        """
+        Score the objects of all the shards and return the best matches.
+
+        Arguments:
+            query (str): string to search for
+            limit (int): max number of results, ``-1`` for all of them. Each
+                shard sends back only its best ``limit`` matches.
+            threshold (float): value under which results are not valid.
+            weights (list): weights of the attributes, see
+                :func:`search.core.search`.
+            use_index (bool): if True (default) each shard scores only the
+                candidates of its index for the query, otherwise all its
+                objects.
+
+        Returns:
+            list: ``(key, match)`` pairs, sorted by relevance.
+        """
+        weights = core._attribute_weights(self.attributes, weights)
+        shards = self._scatter('search', query, limit, threshold or 0, weights,
+                               use_index)
+        merged = heapq.merge(*shards, key=lambda m: (-m[0], m[1]))
+        if limit > 0:
+            merged = itertools.islice(merged, limit)
+        return [(key, match) for match, key in merged]
+
+    def close(self):
+        """Close the shards connections and stop the local shard processes."""
+        for conn in self.connections:
+            try:
+                conn.send(('close',))
+                conn.recv()
+            except (EOFError, OSError):
+                pass
+            conn.close()
+        self.connections = []
+
+        for process in self.processes:
+            process.join()
+        self.processes = []
@@ -0,0 +1,420 @@
+"""
+On-disk snapshot of a :class:`search.index.InvertedIndex`, opened with
+``mmap`` so that all the processes of a host loading the same file share its
+pages, and a cold start does not need to scan and tokenize the whole table.
+
+The file is made of a header followed by flat arrays that are used in place
+through :func:`numpy.frombuffer`, without being copied or parsed:
+
+* the sorted vocabulary of the indexed tokens, with the keys of the objects
+  containing each token (postings);
+* the sorted n-grams of the vocabulary, with the tokens containing each
+  n-gram, for the fuzzy lookup of :class:`search.index.NGramIndex`;
+* the sorted phonetic keys of the vocabulary, with the tokens of each key, if
+  the index has a :class:`search.index.PhoneticIndex`;
+* the children of each token in a Levenshtein :class:`search.index.BKTree`
+  of the vocabulary, with their distances, if the index has one;
+* the sorted keys of the indexed objects, with their tokens.
+
+Keys of the indexed objects must be integers, such as the ``id`` of the
+models.
+"""
+import json
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+
+import jellyfish
+import numpy as np
+
+from search import config, utils
+from search.index import BKTree, InvertedIndex, PhoneticIndex, _get_id
+
+#: magic bytes at the beginning of each snapshot file
+MAGIC = b'SRCHIDX\x03'
+
+_HEADER = struct.Struct('<8sQ')
+_ALIGN = 8
+
+
+def _strings(values):
+    """Sorted fixed width utf-8 array of the given strings."""
+    encoded = sorted(value.encode('utf-8') for value in values)
+    width = max([len(value) for value in encoded] + [1])
+    return np.array(encoded, dtype='S{}'.format(width))
+
+
+def _ragged(lists, dtype):
+    """
+    Flatten a list of lists in a ``(pointers, values)`` pair of arrays, where
+    ``values[pointers[i]:pointers[i + 1]]`` are the values of the i-th list.
+    """
+    pointers = np.zeros(len(lists) + 1, dtype=np.int64)
+    pointers[1:] = np.cumsum([len(values) for values in lists])
+    values = np.fromiter(
+        (value for values in lists for value in values), dtype=dtype,
+        count=int(pointers[-1]))
+    return pointers, values
+
+
+def _lookup(array, value):
+    """Position of ``value`` in the sorted ``array``, None if missing."""
+    position = int(np.searchsorted(array, value))
+    if position < len(array) and array[position] == value:
+        return position
+    return None
+
+
+def _bktree(tokens, token_ids):
+    """
+    Flatten a BK-tree of the vocabulary in ``(root, pointers, distances,
+    children)``, where the children of the i-th token and their distances are
+    at ``pointers[i]:pointers[i + 1]``. ``root`` is -1 if the tree is empty.
+    """
+    tree = BKTree()
+    for token in token_ids:
+        tree.add(token)
+
+    children = [[] for _ in range(len(tokens))]
+    nodes = [tree.root] if tree.root is not None else []
+    while nodes:
+        token, node_children = nodes.pop()
+        for distance, child in sorted(node_children.items()):
+            children[token_ids[token]].append((distance, token_ids[child[0]]))
+            nodes.append(child)
+
+    pointers, distances = _ragged([[d for d, _ in c] for c in children], np.int32)
+    _, child_ids = _ragged([[i for _, i in c] for c in children], np.int32)
+    root = token_ids[tree.root[0]] if tree.root is not None else -1
+    return root, pointers, distances, child_ids
+
+
+def save(index, path, meta=None):
+    """
+    Write a snapshot of ``index`` to ``path``. The file is written aside and
+    then moved in place, so processes that have the previous snapshot open
+    keep reading it unchanged.
+
+    Arguments:
+        index (search.index.InvertedIndex): index to save
+        path (str): destination file
+        meta (dict): JSON serializable values stored in the snapshot, such as
+            the version of the indexed data (see :attr:`SnapshotIndex.meta`)
+
+    Raises:
+        ValueError: if the keys of the indexed objects are not integers.
+    """
+    if not all(isinstance(key, int) for key in index.documents):
+        raise ValueError('snapshot keys must be integers')
+
+    tokens = _strings(index.postings)
+    token_ids = {value.decode('utf-8'): i for i, value in enumerate(tokens)}
+    postings = _ragged(
+        [sorted(index.postings[t.decode('utf-8')]) for t in tokens], np.int64)
+
+    size = index.ngrams.size
+    grams = {}
+    for token, token_id in token_ids.items():
+        for gram in utils.ngrams(token, size):
+            grams.setdefault(gram, []).append(token_id)
+    gram_values = _strings(grams)
+    gram_postings = _ragged(
+        [sorted(grams[g.decode('utf-8')]) for g in gram_values], np.int32)
+    gram_counts = np.array(
+        [len(utils.ngrams(t.decode('utf-8'), size)) for t in tokens], dtype=np.int32)
+
+    phonetic = {}
+    if index.phonetic is not None:
+        for key, key_tokens in index.phonetic.postings.items():
+            phonetic[key] = sorted(token_ids[t] for t in key_tokens)
+    phonetic_keys = _strings(phonetic)
+    phonetic_postings = _ragged(
+        [phonetic[k.decode('utf-8')] for k in phonetic_keys], np.int32)
+
+    if index.bktree is not None:
+        root, bk_pointers, bk_distances, bk_children = _bktree(tokens, token_ids)
+    else:
+        root, bk_pointers, bk_distances, bk_children = _bktree([], {})
+
+    keys = np.array(sorted(index.documents), dtype=np.int64)
+    documents = _ragged(
+        [sorted(token_ids[t] for t in index.documents[key]) for key in keys.tolist()],
+        np.int32)
+
+    arrays = {
+        'tokens': tokens,
+        'postings_ptr': postings[0],
+        'postings': postings[1],
+        'grams': gram_values,
+        'grams_ptr': gram_postings[0],
+        'grams_tokens': gram_postings[1],
+        'gram_counts': gram_counts,
+        'phonetic_keys': phonetic_keys,
+        'phonetic_ptr': phonetic_postings[0],
+        'phonetic_tokens': phonetic_postings[1],
+        'bktree_ptr': bk_pointers,
+        'bktree_distances': bk_distances,
+        'bktree_children': bk_children,
+        'keys': keys,
+        'documents_ptr': documents[0],
+        'documents': documents[1],
+    }
+
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, len(array), offset]
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+
+    header = json.dumps({
+        'attributes': index.attributes,
+        'ngram_size': size,
+        'phonetic': index.phonetic.algorithm if index.phonetic else None,
+        'edit_distance': index.edit_distance,
+        'bktree_root': root,
+        'meta': meta or {},
+        'arrays': layout,
+    }).encode('utf-8')
+    header += b' ' * (-(_HEADER.size + len(header)) % _ALIGN)
+
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as fo:
+        fo.write(_HEADER.pack(MAGIC, len(header)))
+        fo.write(header)
+        for name, array in arrays.items():
+            fo.write(array.tobytes())
+            fo.write(b'\0' * (-array.nbytes % _ALIGN))
+    os.replace(tmp_path, path)
+
+
+def load(path, key=_get_id):
+    """
+    Open the snapshot at ``path``.
+
+    Returns:
+        SnapshotIndex: index reading the snapshot
+
+    Raises:
+        ValueError: if the file is not a snapshot, or was saved in a
+            different format version.
+    """
+    with open(path, 'rb') as fo:
+        buffer = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < _HEADER.size:
+        raise ValueError('{} is not a search index snapshot'.format(path))
+    magic, header_size = _HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError('{} is not a search index snapshot'.format(path))
+
+    start = _HEADER.size + header_size
+    header = json.loads(buffer[_HEADER.size:start].decode('utf-8'))
+    arrays = {
+        name: np.frombuffer(buffer, dtype=dtype, count=count, offset=start + offset)
+        for name, (dtype, count, offset) in header['arrays'].items()
+    }
+    return SnapshotIndex(header['attributes'], arrays, header['ngram_size'],
+                         header['meta'], key, header['phonetic'],
+                         header['edit_distance'], header['bktree_root'])
+
+
+class _Documents(Mapping):
+    """Read-only ``{key: set(tokens)}`` view of a :class:`SnapshotIndex`."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, key):
+        if key in self.index.delta:
+            return self.index.delta.documents[key]
+        if key in self.index.removed:
+            raise KeyError(key)
+        tokens = self.index._base_document(key)
+        if tokens is None:
+            raise KeyError(key)
+        return tokens
+
+    def __iter__(self):
+        for key in self.index._arrays['keys'].tolist():
+            if key not in self.index.removed:
+                yield key
+        for key in self.index.delta.documents:
+            yield key
+
+    def __len__(self):
+        return len(self.index)
+
+
+class SnapshotIndex:
+    """
+    :class:`search.index.InvertedIndex` read from a snapshot file (see
+    :func:`load`), with the same lookup methods.
+
+    The snapshot itself is never modified: objects added, updated or removed
+    after loading are tracked in memory, with a ``delta`` index of the added
+    and updated objects and the set of the ``removed`` keys of the snapshot
+    that are no longer valid.
+
+    Attributes:
+        meta (dict): values stored with :func:`save`
+        phonetic_algorithm (str): algorithm of the phonetic keys of the
+            snapshot, None if it has no phonetic index.
+        edit_distance (int): max edit distance of the BK-tree lookup, None if
+            the snapshot has no BK-tree.
+        documents (Mapping): ``{key: set(tokens)}`` of the indexed objects
+        delta (search.index.InvertedIndex): objects added after loading
+        removed (set): snapshot keys removed or replaced after loading
+    """
+
+    def __init__(self, attributes, arrays, ngram_size, meta=None, key=_get_id,
+                 phonetic=None, edit_distance=None, bktree_root=-1):
+        self.attributes = list(attributes)
+        self.key = key
+        self.meta = meta or {}
+        self.ngram_size = ngram_size
+        self.phonetic_algorithm = phonetic
+        self._encode = PhoneticIndex.ALGORITHMS[phonetic] if phonetic else None
+        self.edit_distance = edit_distance
+        self._bktree_root = bktree_root
+        self.delta = InvertedIndex(attributes, key, phonetic, edit_distance)
+        self.delta.ngrams.size = ngram_size
+        self.removed = set()
+        self.documents = _Documents(self)
+        self._arrays = arrays
+
+    def __len__(self):
+        return len(self._arrays['keys']) - len(self.removed) + len(self.delta)
+
+    def __contains__(self, key):
+        if key in self.delta:
+            return True
+        return key not in self.removed and self._base_position(key) is not None
+
+    def _base_position(self, key):
+        if not isinstance(key, int):
+            return None
+        return _lookup(self._arrays['keys'], key)
+
+    def _base_document(self, key):
+        """Tokens of the object in the snapshot, None if missing."""
+        position = self._base_position(key)
+        if position is None:
+            return None
+        pointers, tokens = self._arrays['documents_ptr'], self._arrays['documents']
+        ids = tokens[pointers[position]:pointers[position + 1]]
+        return {value.decode('utf-8') for value in self._arrays['tokens'][ids]}
+
+    def tokens(self, obj):
+        """Return the set of normalized tokens for all the indexed attributes."""
+        return self.delta.tokens(obj)
+
+    def add(self, obj):
+        """
+        Add an object to the index, replacing the previous entry with the same
+        key if any.
+        """
+        key = self.key(obj)
+        if self._base_position(key) is not None:
+            self.removed.add(key)
+        self.delta.add(obj)
+
+    def remove(self, key):
+        """
+        Remove the object with the given key from the index. Missing keys are
+        ignored.
+        """
+        self.delta.remove(key)
+        if self._base_position(key) is not None:
+            self.removed.add(key)
+
+    def query_tokens(self, query):
+        """Return the normalized tokens of the query string."""
+        return set(utils.tokenize(query.lower()))
+
+    def _similar(self, token, min_similarity=None):
+        """
+        Ids of the snapshot tokens similar to ``token``, as
+        :meth:`search.index.NGramIndex.similar` does.
+        """
+        if min_similarity is None:
+            min_similarity = config.NGRAM_MIN_SIMILARITY
+
+        grams = utils.ngrams(token, self.ngram_size)
+        pointers = self._arrays['grams_ptr']
+        shared = []
+        for gram in grams:
+            position = _lookup(self._arrays['grams'], gram.encode('utf-8'))
+            if position is not None:
+                shared.append(self._arrays['grams_tokens'][
+                    pointers[position]:pointers[position + 1]])
+        if not shared:
+            return np.zeros(0, dtype=np.int32)
+
+        ids, counts = np.unique(np.concatenate(shared), return_counts=True)
+        dice = 2.0 * counts / (len(grams) + self._arrays['gram_counts'][ids])
+        return ids[dice >= min_similarity]
+
+    def _sounding(self, token):
+        """
+        Ids of the snapshot tokens with the same phonetic key of ``token``, as
+        :meth:`search.index.PhoneticIndex.similar` does.
+        """
+        if self._encode is None:
+            return []
+        key = self._encode(token)
+        position = _lookup(self._arrays['phonetic_keys'], key.encode('utf-8')) \
+            if key else None
+        if position is None:
+            return []
+        pointers = self._arrays['phonetic_ptr']
+        return self._arrays['phonetic_tokens'][
+            pointers[position]:pointers[position + 1]].tolist()
+
+    def _within(self, token):
+        """
+        Ids of the snapshot tokens within ``edit_distance`` of ``token``, as
+        :meth:`search.index.BKTree.search` does.
+        """
+        if self.edit_distance is None or self._bktree_root < 0:
+            return []
+
+        tokens = self._arrays['tokens']
+        pointers = self._arrays['bktree_ptr']
+        distances = self._arrays['bktree_distances']
+        children = self._arrays['bktree_children']
+        matches, nodes = [], [self._bktree_root]
+        while nodes:
+            node = nodes.pop()
+            distance = jellyfish.levenshtein_distance(
+                token, tokens[node].decode('utf-8'))
+            if distance <= self.edit_distance:
+                matches.append(node)
+            start, end = pointers[node], pointers[node + 1]
+            if start < end:
+                near = np.abs(distances[start:end] - distance) <= self.edit_distance
+                nodes.extend(children[start:end][near].tolist())
+        return matches
+
+    def candidates(self, query, fuzzy=True):
+        """
+        Return the keys of all the objects that share at least a token with the
+        given query, see :meth:`search.index.InvertedIndex.candidates`.
+        """
+        token_ids = set()
+        for token in self.query_tokens(query):
+            position = _lookup(self._arrays['tokens'], token.encode('utf-8'))
+            if position is not None:
+                token_ids.add(position)
+            if fuzzy:
+                token_ids.update(self._similar(token).tolist())
+                token_ids.update(self._sounding(token))
+                token_ids.update(self._within(token))
+
+        pointers, postings = self._arrays['postings_ptr'], self._arrays['postings']
+        keys = set()
+        for token_id in token_ids:
+            keys.update(postings[pointers[token_id]:pointers[token_id + 1]].tolist())
+
+        keys -= self.removed
+        keys.update(self.delta.candidates(query, fuzzy))
+        return keys
@@ -0,0 +1,203 @@
+"""
+Compressed trie of the tokens of the searched objects, used for prefix
+autocomplete: each node keeps the most popular completions below it, so that
+a lookup only walks the characters of the prefix.
+"""
+import bisect
+import itertools
+from collections import Counter
+
+from search import config, utils
+from search.index import _get_id
+
+
+class _Node:
+    """
+    Node of a :class:`CompletionTrie`: ``label`` is the string on the edge
+    from the parent, ``count`` the popularity of the token ending on the node
+    (0 if none) and ``top`` the best ``(-count, token)`` pairs below it.
+    """
+    __slots__ = ('label', 'children', 'count', 'top')
+
+    def __init__(self, label=''):
+        self.label = label
+        self.children = {}
+        self.count = 0
+        self.top = []
+
+
+class CompletionTrie:
+    """
+    Radix tree (a trie with the single child chains merged in one edge) over
+    the normalized tokens of the indexed attributes, completing a prefix with
+    the most popular tokens starting with it.
+
+    Popularity of a token is the number of indexed objects containing it. The
+    ``size`` best completions are precomputed in each node and updated along
+    the path of each added or removed token, so a lookup costs the length of
+    the prefix and does not depend on the number of tokens.
+
+    Arguments:
+        attributes (list): names of the attributes to index for each object
+        key (callable): function that given an object returns its unique key,
+            defaults to ``obj.id``.
+        size (int): number of completions kept for each node, defaults to
+            :any:`config.SUGGEST_SIZE`.
+
+    Attributes:
+        documents (dict): ``{key: set(tokens)}`` of the indexed objects, used
+            to update and remove them.
+
+    Example:
+        >>> trie = CompletionTrie(['name']).build(Item.select())
+        >>> trie.complete('sca')
+        ['scarpe', 'scarpette', 'scaffale']
+    """
+
+    def __init__(self, attributes, key=_get_id, size=None):
+        self.attributes = list(attributes)
+        self.key = key
+        self.size = size or config.SUGGEST_SIZE
+        self.documents = {}
+        self.root = _Node()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, key):
+        return key in self.documents
+
+    def tokens(self, obj):
+        """Return the set of normalized tokens for all the indexed attributes."""
+        return utils.tokens_set(obj, self.attributes)
+
+    def build(self, dataset):
+        """
+        Clear the trie and add every object of the given dataset.
+
+        Returns:
+            CompletionTrie: the callee trie.
+        """
+        self.documents = {self.key(obj): self.tokens(obj) for obj in dataset}
+        self.root = _Node()
+        counts = Counter(t for tokens in self.documents.values() for t in tokens)
+        for token, count in counts.items():
+            self._update(token, count)
+        return self
+
+    def add(self, obj):
+        """
+        Add an object to the trie, replacing the previous entry with the same
+        key if any.
+        """
+        key = self.key(obj)
+        self.remove(key)
+
+        tokens = self.tokens(obj)
+        self.documents[key] = tokens
+        for token in tokens:
+            self._update(token, 1)
+
+    def remove(self, key):
+        """
+        Remove the object with the given key from the trie. Missing keys are
+        ignored.
+        """
+        for token in self.documents.pop(key, ()):
+            self._update(token, -1)
+
+    def complete(self, prefix, limit=None):
+        """
+        Return the most popular tokens starting with ``prefix``.
+
+        Arguments:
+            prefix (str): beginning of the token, compared lowercase
+            limit (int): max number of completions, at most (and by default)
+                the trie ``size``.
+
+        Returns:
+            list: tokens ordered by popularity, then alphabetically.
+        """
+        node = self._find(prefix.strip().lower())
+        if node is None:
+            return []
+        return [token for _, token in node.top[:limit or self.size]]
+
+    def _find(self, prefix):
+        """Return the topmost node whose tokens all start with ``prefix``."""
+        node = self.root
+        while prefix:
+            child = node.children.get(prefix[0])
+            if child is None:
+                return None
+            if child.label.startswith(prefix):
+                return child
+            if not prefix.startswith(child.label):
+                return None
+            prefix = prefix[len(child.label):]
+            node = child
+        return node
+
+    def _update(self, token, delta):
+        """
+        Add ``delta`` to the popularity of ``token``, splitting the edges as
+        needed, and refresh the completions of the nodes on its path.
+        """
+        path = [self.root]
+        node, rest = self.root, token
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None:
+                child = _Node(rest)
+                node.children[rest[0]] = child
+            else:
+                common = _common_prefix(child.label, rest)
+                if common < len(child.label):
+                    middle = _Node(child.label[:common])
+                    child.label = child.label[common:]
+                    middle.children[child.label[0]] = child
+                    middle.top = list(child.top)
+                    node.children[rest[0]] = middle
+                    child = middle
+            rest = rest[len(child.label):]
+            node = child
+            path.append(node)
+
+        node.count += delta
+        count = node.count
+        ends = list(itertools.accumulate(len(n.label) for n in path))
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            if depth and node.count <= 0 and not node.children:
+                # drop the leaves without tokens left
+                del path[depth - 1].children[node.label[0]]
+                continue
+
+            position = next(
+                (i for i, (_, t) in enumerate(node.top) if t == token), None)
+            if delta > 0:
+                # only the entry of the token changed, and it can only go up
+                if position is not None:
+                    del node.top[position]
+                bisect.insort(node.top, (-count, token))
+                del node.top[self.size:]
+            elif position is not None:
+                # a token outside the completions may now rank higher
+                self._refresh(node, token[:ends[depth]])
+
+    def _refresh(self, node, string):
+        """Recompute the best completions of a node from its children."""
+        entries = [entry for child in node.children.values() for entry in child.top]
+        if node.count > 0:
+            entries.append((-node.count, string))
+        node.top = sorted(entries)[:self.size]
+
+
+def _common_prefix(first, second):
+    """Length of the common prefix of the two strings."""
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
@@ -2,10 +2,22 @@
 Utility module for the search engine, contains various functions to do common
 operations on lists and set of iterables
 """
+import functools
 import re
+
+import jellyfish as jf
+
 from search import config
 
 
+#: Memoized ``jellyfish.jaro_winkler``: catalogs vocabularies are small compared
+#: to the number of token pairs scored, so the same pairs are compared over and
+#: over across searches. The memo table is bounded to
+#: :any:`config.JW_CACHE_SIZE` pairs (LRU) and ``jaro_winkler.cache_info()``
+#: reports its hits and misses.
+jaro_winkler = functools.lru_cache(maxsize=config.JW_CACHE_SIZE)(jf.jaro_winkler)
+
+
 def _dec(fl):
     """Return a stringified more readable float, for debugging purposes."""
     return '{:.2f}'.format(fl)
@@ -81,6 +93,65 @@ def tokenize(string):
     ]
 
 
+def tokenize_attributes(obj, attributes):
+    """
+    Return the tokens list (see :func:`tokenize`) of the lowercased value of
+    each one of the given attributes of ``obj``.
+
+    Example:
+        >>> utils.tokenize_attributes(item, ['name', 'category'])
+        [['blue', 'shoes'], ['shoes']]
+
+    """
+    return [tokenize(getattr(obj, attr).lower()) for attr in attributes]
+
+
+def tokens_set(obj, attributes):
+    """
+    Return the set of tokens (see :func:`tokenize`) of the lowercased values
+    of the given attributes of ``obj``, missing values have no tokens.
+
+    Example:
+        >>> utils.tokens_set(item, ['name', 'category'])
+        {'blue', 'shoes'}
+
+    """
+    tokens = set()
+    for attr in attributes:
+        tokens.update(tokenize((getattr(obj, attr) or '').lower()))
+    return tokens
+
+
+def token_prefixes(string, length):
+    """
+    Return the distinct prefixes of the given ``length`` of the tokens of the
+    lowercased string, sorted.
+
+    Example:
+        >>> utils.token_prefixes('Tavolo da cucina', 3)
+        ['cuc', 'tav']
+
+    """
+    return sorted({token[:length] for token in tokenize(string.lower())})
+
+
+def ngrams(token, size):
+    """
+    Return the set of character n-grams of the given token, padded with a
+    ``$`` on both sides so that the start and end of the word are taken into
+    account. Tokens shorter than ``size`` return the padded token itself.
+
+    Example:
+        >>> utils.ngrams('shoe', 3)
+        {'$sh', 'sho', 'hoe', 'oe$'}
+
+    """
+    token = '${}$'.format(token)
+    if len(token) <= size:
+        return {token}
+    return {token[i:i + size] for i in range(len(token) - size + 1)}
+
+
 def max_distance(phrase, word_index):
     """
     Given a list an int in range(len(phrase)), determine the maximum
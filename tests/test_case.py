@@ -3,13 +3,14 @@ Test case for setup and teardown methods
 """
 
 import pytest
-from peewee import SqliteDatabase
+from playhouse.sqlite_ext import SqliteExtDatabase
 
 from app import app
-from models import Address, Item, Order, OrderItem, Picture, User, Favorite
+from models import (Address, Item, ItemDocument, Order, OrderItem, Picture,
+                    User, Favorite)
 
 
-TABLES = [Address, Item, Order, OrderItem, Picture, User, Favorite]
+TABLES = [Address, Item, ItemDocument, Order, OrderItem, Picture, User, Favorite]
 """
 TABLES = list(BaseModel)
 
@@ -23,13 +24,13 @@ class TestCase:
     """
     Created TestCase to avoid duplicated code in the other tests
     """
-    TEST_DB = SqliteDatabase(':memory:')
+    TEST_DB = SqliteExtDatabase(':memory:')
 
     @classmethod
     def setup_class(cls):
         """
         When a Test is created override the ``database`` attribute for all
-        the tables with a SqliteDatabase in memory.
+        the tables with a SqliteExtDatabase in memory.
         """
         for table in TABLES:
             table._meta.database = cls.TEST_DB
@@ -39,7 +40,16 @@ class TestCase:
 
     def setup_method(self):
         """
-        When setting up a new test method clear all the tables
+        When setting up a new test method clear all the tables and the Item
+        search structures, kept by the class across tests (the tables are
+        cleared with bulk queries, that fire no signals).
         """
         for table in TABLES:
             table.delete().execute()
+
+        Item._search_index = None
+        Item._search_index_fingerprint = None
+        Item._suggest_trie = None
+        Item._suggest_trie_fingerprint = None
+        Item._search_token_cache = None
+        Item._search_result_cache = None
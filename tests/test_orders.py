@@ -8,9 +8,11 @@ from http.client import (BAD_REQUEST, CREATED, NO_CONTENT, NOT_FOUND, OK,
 import pytest
 from uuid import uuid4
 
+from exceptions import InsufficientAvailabilityException
 from models import Item, Order, OrderItem, WrongQuantity
 from tests.test_case import TestCase
 from tests.test_utils import (RESULTS, add_address, add_admin_user, add_user,
+                              add_item, capture_queries,
                               count_order_items, format_jsonapi_request,
                               open_with_auth, assert_valid_response,
                               wrong_dump)
@@ -60,6 +62,34 @@ class TestOrders(TestCase):
         assert resp.status_code == OK
         assert_valid_response(resp.data, expected_result)
 
+    def test_get_orders__constant_queries(self):
+        user = add_user(None, TEST_USER_PSW)
+        addr = add_address(user=user)
+        items = [add_item(name='Item {}'.format(i), category='scarpe', price=10)
+                 for i in range(4)]
+        Item.update(availability=100).execute()
+        for item in items:
+            item.availability = 100
+
+        def get_orders():
+            with capture_queries() as queries:
+                resp = self.app.get('/orders/')
+            assert resp.status_code == OK
+            return json.loads(resp.data), queries
+
+        Order.create_order(user, addr, {items[0]: 1})
+        orders, queries = get_orders()
+        assert len(orders) == 1
+        # orders with users and addresses, then order items with items
+        assert len(queries) == 2
+
+        for count in range(1, 5):
+            Order.create_order(user, addr, {item: 2 for item in items[:count]})
+        orders, queries = get_orders()
+        assert [len(o['data']['relationships']['items']['data']) for o in orders] == [
+            1, 1, 2, 3, 4]
+        assert len(queries) == 2
+
     def test_get_order__non_existing_empty_orders(self):
         resp = self.app.get('/orders/{}'.format(uuid4()))
         assert resp.status_code == NOT_FOUND
@@ -120,6 +150,36 @@ class TestOrders(TestCase):
         assert resp.status_code == OK
         assert json.loads(resp2.data) == expected_result2
 
+    def test_create_order__constant_queries(self):
+        user = add_user(None, TEST_USER_PSW)
+        addr = add_address(user=user)
+        items = [add_item(name='Item {}'.format(i), category='scarpe')
+                 for i in range(5)]
+        Item.update(availability=10).execute()
+
+        def create_order(items):
+            order = format_jsonapi_request('order', {'relationships': {
+                'items': [{'id': str(item.uuid), 'type': 'item', 'quantity': 2}
+                          for item in items],
+                'delivery_address': {'type': 'address', 'id': str(addr.uuid)},
+                'user': {'type': 'user', 'id': str(user.uuid)},
+            }})
+            with capture_queries() as queries:
+                resp = open_with_auth(self.app, API_ENDPOINT.format('orders/'),
+                                      'POST', user.email, TEST_USER_PSW,
+                                      'application/json', json.dumps(order))
+            assert resp.status_code == CREATED
+            return [q.split(' (')[0] for q in queries]
+
+        small, large = create_order(items[:1]), create_order(items)
+        assert len(small) == len(large)
+        assert len([q for q in large if q.startswith('UPDATE "item"')]) == 1
+        assert len([q for q in large if q.startswith('INSERT INTO "order"')]) == 1
+        assert len([q for q in large if q.startswith('INSERT INTO "orderitem"')]) == 1
+        assert OrderItem.select().count() == 6
+        assert [i.availability for i in Item.select().order_by(Item.id)] == [
+            6, 8, 8, 8, 8]
+
     def test_create_order__success(self):
         Item.create(
             uuid='429994bf-784e-47cc-a823-e0c394b823e8',
@@ -1364,3 +1424,96 @@ class TestOrders(TestCase):
         # check assumed total price
         total_price = item1.price + item2.price * 2 + item3.price * 3
         assert order.total_price == total_price
+
+    def test_item_update_availability(self):
+        item1 = add_item(name='Item 1', category='scarpe')
+        item2 = add_item(name='Item 2', category='scarpe')
+        Item.update(availability=5).execute()
+        item1.availability = item2.availability = 5
+
+        with capture_queries() as queries:
+            Item.update_availability({item1: 2, item2: 5})
+        assert len([q for q in queries if q.startswith('UPDATE')]) == 1
+        assert (item1.availability, item2.availability) == (3, 0)
+        assert [i.availability for i in Item.select().order_by(Item.id)] == [3, 0]
+
+        # nothing is reserved if one of the items is not available
+        with pytest.raises(InsufficientAvailabilityException) as exc_info:
+            Item.update_availability({item1: 1, item2: 1})
+        assert exc_info.value.item == item2
+        assert [i.availability for i in Item.select().order_by(Item.id)] == [3, 0]
+
+        Item.update_availability({item1: -1, item2: -4})
+        assert [i.availability for i in Item.select().order_by(Item.id)] == [4, 4]
+
+    def test_order_update_items__concurrent_orders(self):
+        """
+        Orders created from stale instances can't reserve more than the
+        availability stored in the database.
+        """
+        user = add_user(None, TEST_USER_PSW)
+        addr = add_address(user=user)
+        add_item(name='Item', category='scarpe')
+        Item.update(availability=3).execute()
+        first, second = Item.get(), Item.get()
+
+        order1 = Order.create(delivery_address=addr, user=user)
+        order2 = Order.create(delivery_address=addr, user=user)
+        order1.add_item(first, 2)
+
+        # `second` still reports 3 items available
+        with pytest.raises(InsufficientAvailabilityException):
+            order2.add_item(second, 2)
+
+        assert Item.get().availability == 1
+        assert len(order2.order_items) == 0
+        order2.add_item(second, 1)
+        assert Item.get().availability == 0
+
+    def test_order_edit_items_quantity__bulk_update(self):
+        user = add_user(None, TEST_USER_PSW)
+        addr = add_address(user=user)
+        items = [add_item(name='Item {}'.format(i), category='scarpe', price=10 + i)
+                 for i in range(5)]
+        Item.update(availability=10).execute()
+        for item in items:
+            item.availability = 10
+
+        order = Order.create(delivery_address=addr, user=user)
+        order.update_items({item: 2 for item in items})
+
+        with capture_queries() as queries:
+            order.edit_items_quantity({item: i - 1 for i, item in enumerate(items)})
+        # one availability and one orderitem update, whatever the items count
+        assert len([q for q in queries if q.startswith('UPDATE')]) == 2
+
+        lines = (OrderItem.select().where(OrderItem.order == order)
+                 .order_by(OrderItem.item))
+        assert [(oi.quantity, oi.subtotal) for oi in lines] == [
+            (1, 10), (2, 22), (3, 36), (4, 52), (5, 70)]
+        assert [i.availability for i in Item.select().order_by(Item.id)] == [
+            9, 8, 7, 6, 5]
+
+        # items that are not in the order are skipped
+        other = add_item(name='Other', category='scarpe', price=10)
+        available = other.availability
+        order.edit_items_quantity({other: 1})
+        assert other.availability == available
+        assert Item.get(Item.id == other.id).availability == available
+        assert len(order.order_items) == 5
+
+    def test_order_update_items__single_orderitems_query(self):
+        user = add_user(None, TEST_USER_PSW)
+        addr = add_address(user=user)
+        items = [add_item(name='Item {}'.format(i), category='scarpe', price=10)
+                 for i in range(3)]
+        order = Order.create(delivery_address=addr, user=user)
+        order.update_items({items[0]: 1, items[1]: 1})
+
+        with capture_queries() as queries:
+            order.update_items({items[0]: 2, items[1]: 0, items[2]: 1})
+        selects = [q for q in queries
+                   if q.startswith('SELECT') and 'FROM "orderitem"' in q]
+        assert len(selects) == 1
+        assert sorted((oi.item_id, oi.quantity) for oi in order.order_items) == [
+            (items[0].id, 2), (items[2].id, 1)]
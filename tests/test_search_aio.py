@@ -0,0 +1,102 @@
+"""
+Test suite for the asyncio search API (:mod:`search.aio`).
+"""
+import asyncio
+import os
+import tempfile
+import threading
+
+import pytest
+from playhouse.sqlite_ext import SqliteExtDatabase
+
+from models import Item
+import search
+from search import aio
+from search.index import InvertedIndex
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_utils import ATTRIBUTES, random_docs
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+async def collect(stream):
+    return [results async for results in stream]
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+@pytest.mark.parametrize('limit', [-1, 1, 10])
+@pytest.mark.parametrize('query', ['tavolo', 'sedie cucina', 'divano di legno'])
+def test_search__same_as_search(loop, query, limit, use_index):
+    docs = random_docs(300)
+    index = InvertedIndex(ATTRIBUTES).build(docs) if use_index else None
+
+    expected = search.search(query, ATTRIBUTES, docs, limit, index=index)
+    result = loop.run_until_complete(aio.search(
+        query, ATTRIBUTES, docs, limit, index=index, chunk_size=32, loop=loop))
+
+    assert result == expected
+
+
+def test_search_stream__partial_results(loop):
+    docs = random_docs(300)
+    partials = loop.run_until_complete(collect(aio.search_stream(
+        'tavolo', ATTRIBUTES, docs, 10, chunk_size=50, loop=loop)))
+
+    assert len(partials) > 1
+    assert all(len(p) <= 10 for p in partials)
+    assert partials[-1] == search.search('tavolo', ATTRIBUTES, docs, 10)
+
+
+def test_search__empty_dataset(loop):
+    assert loop.run_until_complete(aio.search('tavolo', ATTRIBUTES, [], loop=loop)) == []
+
+
+def test_search__cancel(loop):
+    docs = random_docs(300)
+    chunks = []
+    release = threading.Event()
+
+    def tokenizer(obj, attributes):
+        # block the first chunk until the task is cancelled
+        release.wait(5)
+        chunks.append(obj)
+        return search.utils.tokenize_attributes(obj, attributes)
+
+    async def cancel_search():
+        task = loop.create_task(aio.search(
+            'tavolo', ATTRIBUTES, docs, 10, tokenizer=tokenizer, chunk_size=10,
+            loop=loop))
+        await asyncio.sleep(0.01, loop=loop)
+        task.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # let the executor finish the running chunk
+        await asyncio.sleep(0.05, loop=loop)
+
+    loop.run_until_complete(cancel_search())
+    assert len(chunks) == 10
+
+
+class TestItemAsyncSearch(TestCase):
+    # the dataset is loaded by an executor thread, with its own connection:
+    # an in-memory database would be a different, empty one.
+    TEST_DB = SqliteExtDatabase(os.path.join(tempfile.mkdtemp(), 'aio.db'))
+
+    def test_search__query(self, loop):
+        for name in ['divano', 'divano letto', 'letto', 'poltrona']:
+            test_utils.add_item(name=name, description='in tessuto', category='arredo')
+
+        result = loop.run_until_complete(aio.search(
+            'divano', Item._search_attributes, Item.select(), 10,
+            chunk_size=2, loop=loop))
+
+        expected = search.search('divano', Item._search_attributes, Item.select(), 10)
+        assert [r.name for r in result][:2] == ['divano', 'divano letto']
+        assert [r.id for r in result] == [r.id for r in expected]
@@ -0,0 +1,44 @@
+"""
+Test suite for the vectorized scoring of :mod:`search.batch`.
+"""
+import random
+
+import pytest
+
+import search
+from search import batch, utils
+from search.core import similarity
+from tests.test_searchitem import NAMES
+from tests.test_utils import Doc, random_phrase
+
+
+@pytest.mark.parametrize('query', [
+    'tavolo', 'tavolo sedie', 'sedia da cucina', 'letto letto divano',
+    'scarpe di legno con tavolo set', 'xy',
+])
+def test_similarity_batch__matches_similarity(query):
+    random.seed(query)
+    strings = NAMES + [random_phrase(random.randint(0, 8)) for _ in range(200)]
+
+    documents = [utils.tokenize(string.lower()) for string in strings]
+    result = batch.similarity_batch(utils.tokenize(query.lower()), documents)
+
+    expected = [similarity(query, string) for string in strings]
+    assert result.tolist() == pytest.approx(expected)
+
+
+def test_search__vectorized():
+    random.seed(42)
+    docs = [Doc(i, random_phrase(random.randint(1, 4)), random_phrase(6))
+            for i in range(300)]
+
+    for query in ['tavolo', 'sedie cucina', 'divano letto']:
+        expected = search.search(query, ['name', 'description'], docs, 20)
+        result = search.search(
+            query, ['name', 'description'], docs, 20, vectorized=True)
+
+        assert [d.id for d in result] == [d.id for d in expected]
+
+
+def test_score_batch__empty():
+    assert batch.score_batch('tavolo', [], [1]).tolist() == []
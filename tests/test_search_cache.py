@@ -0,0 +1,174 @@
+"""
+Test suite for the search engine caches (:mod:`search.cache`).
+"""
+import jellyfish
+
+import search
+from models import Item
+from search import utils
+from search.cache import ResultCache, TokenCache
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_utils import Doc
+
+
+class TestTokenCache:
+    def test_tokens(self):
+        cache = TokenCache()
+        doc = Doc(1, 'Tavolo da cucina', 'legno massello', updated_at=1)
+
+        assert cache.tokens(doc, ['name']) == [['tavolo', 'cucina']]
+        assert cache.tokens(doc, ['name']) == [['tavolo', 'cucina']]
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 10000}
+
+        # missing attributes are tokenized and added to the entry
+        assert cache.tokens(doc, ['description', 'name']) == [
+            ['legno', 'massello'], ['tavolo', 'cucina']]
+        assert cache.tokens(doc, ['description']) == [['legno', 'massello']]
+        assert (cache.hits, cache.misses) == (2, 2)
+
+    def test_tokens__new_version(self):
+        cache = TokenCache()
+        cache.tokens(Doc(1, 'tavolo', updated_at=1), ['name'])
+
+        assert cache.tokens(Doc(1, 'sedia', updated_at=2), ['name']) == [['sedia']]
+        assert (cache.hits, cache.misses, len(cache)) == (0, 2, 1)
+
+    def test_tokens__lru_eviction(self):
+        cache = TokenCache(maxsize=2)
+        docs = [Doc(i, 'tavolo', updated_at=1) for i in range(3)]
+
+        cache.tokens(docs[0], ['name'])
+        cache.tokens(docs[1], ['name'])
+        cache.tokens(docs[0], ['name'])
+        cache.tokens(docs[2], ['name'])  # evicts docs[1]
+        assert len(cache) == 2
+
+        cache.tokens(docs[0], ['name'])
+        cache.tokens(docs[1], ['name'])
+        assert (cache.hits, cache.misses) == (2, 4)
+
+    def test_clear(self):
+        cache = TokenCache()
+        cache.tokens(Doc(1, 'tavolo', updated_at=1), ['name'])
+        cache.clear()
+
+        assert cache.stats() == {'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 10000}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResultCache:
+    def test_get_set(self):
+        cache = ResultCache()
+        key = cache.key('tavolo', 10, ['name'], [1], 0.75)
+
+        assert cache.get(key, 0) is None
+        cache.set(key, 0, [3, 1, 2])
+        assert cache.get(key, 0) == [3, 1, 2]
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 1000}
+
+    def test_key__normalized_query(self):
+        key = ResultCache.key('Tavolo, da CUCINA', 10, ['name'], None, 0.75)
+
+        assert key == ResultCache.key('tavolo cucina', 10, ['name'], [], 0.75)
+        assert key != ResultCache.key('tavolo cucina', 5, ['name'], [], 0.75)
+        assert key != ResultCache.key('tavolo cucina', 10, ['name'], [], 0.75, 'x')
+
+    def test_get__outdated_version(self):
+        cache = ResultCache()
+        cache.set('key', 1, [1])
+
+        assert cache.get('key', 2) is None
+        assert len(cache) == 0
+
+    def test_get__expired(self):
+        clock = FakeClock()
+        cache = ResultCache(ttl=60, clock=clock)
+        cache.set('key', 1, [1])
+
+        clock.now = 59
+        assert cache.get('key', 1) == [1]
+        clock.now = 60
+        assert cache.get('key', 1) is None
+        assert len(cache) == 0
+
+    def test_set__lru_eviction(self):
+        cache = ResultCache(maxsize=2)
+        cache.set('a', 1, [1])
+        cache.set('b', 1, [2])
+        cache.get('a', 1)
+        cache.set('c', 1, [3])  # evicts b
+
+        assert cache.get('b', 1) is None
+        assert cache.get('a', 1) == [1]
+        assert cache.get('c', 1) == [3]
+
+
+def test_jaro_winkler__memoized():
+    utils.jaro_winkler.cache_clear()
+
+    assert utils.jaro_winkler('tavolo', 'tavola') == \
+        jellyfish.jaro_winkler('tavolo', 'tavola')
+    utils.jaro_winkler('tavolo', 'tavola')
+
+    info = utils.jaro_winkler.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+class TestItemTokenCache(TestCase):
+    def test_search__token_cache(self):
+        Item.search_token_cache().clear()
+        item = test_utils.add_item(name='divano', description='', category='')
+        test_utils.add_item(name='letto', description='', category='')
+
+        Item.search('divano', Item.select())
+        Item.search('letto', Item.select())
+        assert (Item.search_token_cache().hits,
+                Item.search_token_cache().misses) == (2, 2)
+
+        item.name = 'poltrona'
+        item.save()
+        result = Item.search('poltrona', Item.select())
+        assert result[0].name == 'poltrona'
+        assert (Item.search_token_cache().hits,
+                Item.search_token_cache().misses) == (3, 3)
+
+
+class TestItemResultCache(TestCase):
+    def test_search__result_cache(self, mocker):
+        Item.search_result_cache().clear()
+        divano = test_utils.add_item(name='divano', description='', category='')
+        test_utils.add_item(name='divano letto', description='', category='')
+        spy = mocker.spy(search, 'search')
+
+        first = Item.search('divano', Item.select(), 5, use_cache=True)
+        second = Item.search('Divano!', Item.select(), 5, use_cache=True)
+        assert [i.id for i in second] == [i.id for i in first]
+        assert spy.call_count == 1
+
+        # saving an item bumps the catalog version
+        divano.name = 'poltrona'
+        divano.save()
+        result = Item.search('divano', Item.select(), 5, use_cache=True)
+        assert [i.name for i in result] == ['divano letto', 'poltrona']
+        assert spy.call_count == 2
+
+        divano.delete_instance()
+        Item.search('divano', Item.select(), 5, use_cache=True)
+        assert spy.call_count == 3
+
+    def test_search__result_cache_dataset(self):
+        Item.search_result_cache().clear()
+        test_utils.add_item(name='divano', description='', category='', price=10)
+        test_utils.add_item(name='divano', description='', category='', price=20)
+
+        cheap = Item.select().where(Item.price < 15)
+        assert len(Item.search('divano', Item.select(), 5, use_cache=True)) == 2
+        assert len(Item.search('divano', cheap, 5, use_cache=True)) == 1
@@ -0,0 +1,164 @@
+"""
+Test suite for the search functions of :mod:`search.core`.
+"""
+import pytest
+
+import search
+from search import core
+from search.index import InvertedIndex
+from tests.test_utils import ATTRIBUTES, random_docs
+
+
+@pytest.mark.parametrize('weights', [None, [1, 1, 1], [1, 3, 2]])
+@pytest.mark.parametrize('limit', [1, 5, 30])
+@pytest.mark.parametrize('query', ['tavolo', 'sedie cucina', 'divano di legno'])
+def test_search__top_k_same_as_full_sort(query, limit, weights):
+    docs = random_docs(300)
+
+    expected = search.search(query, ATTRIBUTES, docs, -1, weights=weights)[:limit]
+    result = search.search(query, ATTRIBUTES, docs, limit, weights=weights)
+    vectorized = search.search(
+        query, ATTRIBUTES, docs, limit, weights=weights, vectorized=True)
+
+    assert [d.id for d in result] == [d.id for d in expected]
+    assert [d.id for d in vectorized] == [d.id for d in expected]
+
+
+def test_search__top_k_skips_attributes(mocker):
+    docs = random_docs(300)
+    spy = mocker.spy(core, 'similarity_tokens')
+
+    search.search('tavolo', ATTRIBUTES, docs, 5)
+
+    assert spy.call_count < len(docs) * len(ATTRIBUTES)
+
+
+def test_search__threshold():
+    docs = random_docs(100)
+
+    result = search.search('tavolo', ATTRIBUTES, docs, 10, threshold=0.99)
+
+    assert result
+    assert all('tavolo' in (d.name + d.category + d.description) for d in result)
+
+
+@pytest.fixture
+def parallel_min_size(monkeypatch):
+    monkeypatch.setattr(search.config, 'PARALLEL_MIN_SIZE', 100)
+    yield
+    search.parallel.shutdown()
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+@pytest.mark.parametrize('limit', [-1, 1, 10])
+def test_search__parallel_same_as_single_process(parallel_min_size, limit, vectorized):
+    docs = random_docs(300)
+
+    expected = search.search('sedie cucina', ATTRIBUTES, docs, limit,
+                             vectorized=vectorized)
+    result = search.search('sedie cucina', ATTRIBUTES, docs, limit,
+                           vectorized=vectorized, processes=3)
+
+    assert [d.id for d in result] == [d.id for d in expected]
+
+
+def test_search__parallel_small_dataset_single_process(parallel_min_size, mocker):
+    spy = mocker.spy(search.parallel, 'map_shards')
+
+    search.search('tavolo', ATTRIBUTES, random_docs(99), 5, processes=3)
+    assert spy.call_count == 0
+
+    search.search('tavolo', ATTRIBUTES, random_docs(100), 5, processes=3)
+    assert spy.call_count == 1
+
+
+def test_shards():
+    docs = list(range(10))
+
+    assert search.parallel.shards(docs, 3) == [
+        (0, [0, 1, 2, 3]), (4, [4, 5, 6, 7]), (8, [8, 9])]
+    assert search.parallel.shards(docs, 20) == [(i, [i]) for i in range(10)]
+    assert search.parallel.shards([], 3) == []
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+def test_search_many__same_as_search(use_index):
+    docs = random_docs(300)
+    index = InvertedIndex(ATTRIBUTES).build(docs) if use_index else None
+    queries = [
+        {'query': 'tavolo', 'limit': 5},
+        {'query': 'sedie cucina', 'weights': [1, 3, 2]},
+        {'query': 'divano di legno', 'limit': 10, 'weights': [1, 1, 1]},
+        {'query': 'poltrona', 'limit': 3},
+    ]
+
+    results = search.search_many(queries, ATTRIBUTES, docs, index=index)
+
+    assert len(results) == len(queries)
+    for query, result in zip(queries, results):
+        expected = search.search(query['query'], ATTRIBUTES, docs,
+                                 query.get('limit', -1), weights=query.get('weights'),
+                                 index=index)
+        assert [d.id for d in result] == [d.id for d in expected]
+
+
+def test_search_many__tokenizes_once(mocker):
+    docs = random_docs(50)
+    spy = mocker.spy(search.utils, 'tokenize_attributes')
+
+    search.search_many([{'query': 'tavolo'}, {'query': 'sedie'}], ATTRIBUTES, docs)
+
+    assert spy.call_count == len(docs)
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+@pytest.mark.parametrize('limit', [-1, 5])
+@pytest.mark.parametrize('query', ['tavolo', 'sedie cucina', 'divano di legno'])
+def test_search__explain_same_as_search(query, limit, use_index):
+    docs = random_docs(200)
+    index = InvertedIndex(ATTRIBUTES).build(docs) if use_index else None
+    explanation = search.Explanation()
+
+    expected = search.search(query, ATTRIBUTES, docs, limit, index=index)
+    result = search.search(query, ATTRIBUTES, docs, limit, index=index,
+                           explain=explanation)
+
+    assert result == expected
+    assert len(explanation.results) == len(result)
+    assert explanation.query == search.utils.tokenize(query)
+    assert explanation.counts['scored'] == (
+        len(index.candidates(query)) if use_index else len(docs))
+    stages = ['load', 'tokenize', 'scoring', 'sort']
+    assert list(explanation.timings) == (['candidates'] if use_index else []) + stages
+
+    weights = core._attribute_weights(ATTRIBUTES, None)
+    for obj, breakdown in zip(result, explanation.results):
+        document = search.utils.tokenize_attributes(obj, ATTRIBUTES)
+        assert breakdown['match'] == core._score(
+            explanation.query, document, ATTRIBUTES, weights)
+        attr = breakdown['attributes'][breakdown['attribute']]
+        assert breakdown['match'] == attr['similarity'] * attr['weight']
+
+
+def test_search__explain_scores_as_search(mocker):
+    docs = random_docs(200)
+    explanation = search.Explanation()
+    score_spy = mocker.spy(core, '_score')
+    explain_spy = mocker.spy(core, 'explain_score')
+
+    result = search.search('tavolo', ATTRIBUTES, docs, 5, explain=explanation)
+
+    # the top-k selection prunes the objects that can't enter it
+    assert score_spy.call_count == len(docs)
+    assert any(call[0][4] is not None for call in score_spy.call_args_list)
+    assert explain_spy.call_count == len(result) == 5
+
+
+def test_explain_similarity():
+    explained = core.explain_similarity(['divano', 'letto'], ['letto'])
+
+    assert explained['similarity'] == core.similarity_tokens(['divano', 'letto'], ['letto'])
+    assert [t['token'] for t in explained['tokens']] == ['divano', 'letto']
+    assert explained['tokens'][1] == {
+        'token': 'letto', 'match': 'letto', 'jaro_winkler': 1.0, 'positional': 1}
+    assert core.explain_similarity([], ['letto'])['similarity'] == 0
@@ -0,0 +1,64 @@
+"""
+Test suite for the sharded search index (:mod:`search.sharded`).
+"""
+import pytest
+
+import search
+from search.sharded import ShardedIndex, shard_of
+from tests.test_utils import ATTRIBUTES, Doc, random_docs
+
+
+@pytest.fixture(scope='module')
+def docs():
+    return random_docs(300, seed=7)
+
+
+@pytest.fixture(scope='module')
+def index(docs):
+    with ShardedIndex.local(ATTRIBUTES, 3) as index:
+        index.build(docs)
+        yield index
+
+
+def test_shard_of():
+    assert {shard_of(key, 4) for key in range(100)} == {0, 1, 2, 3}
+    assert shard_of(42, 4) == shard_of('42', 4)
+
+
+def test_build(index, docs):
+    assert len(index) == len(docs)
+    assert index.candidates('sedie') == search.InvertedIndex(
+        ATTRIBUTES).build(docs).candidates('sedie')
+
+
+@pytest.mark.parametrize('use_index', [True, False])
+@pytest.mark.parametrize('limit', [-1, 1, 10])
+@pytest.mark.parametrize('query', ['tavolo', 'sedie cucina', 'divano di legno'])
+def test_search__same_as_search(index, docs, query, limit, use_index):
+    candidates = search.InvertedIndex(ATTRIBUTES).build(docs) if use_index else None
+    expected = search.search(query, ATTRIBUTES, docs, limit, index=candidates)
+
+    result = index.search(query, limit, use_index=use_index)
+
+    assert [key for key, _ in result] == [doc.id for doc in expected]
+    assert [m for _, m in result] == sorted((m for _, m in result), reverse=True)
+
+
+def test_add_remove(docs):
+    with ShardedIndex.local(ATTRIBUTES, 2) as index:
+        index.build(docs[:10])
+        index.add(Doc(1000, 'poltrona relax', 'pelle', 'divano'))
+        index.add(Doc(3, 'poltrona', 'tessuto', 'divano'))
+        index.remove(4)
+        index.remove(4242)
+
+        assert len(index) == 10
+        assert {key for key, _ in index.search('poltrona', 10)} >= {1000, 3}
+        assert 4 not in index.candidates(docs[4].name)
+
+
+def test_shard_error(index):
+    with pytest.raises(ValueError):
+        index._call(0, 'unknown')
+    # the shard keeps serving after an error
+    assert len(index) == 300
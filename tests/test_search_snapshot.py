@@ -0,0 +1,150 @@
+"""
+Test suite for the search index snapshots (:mod:`search.snapshot`).
+"""
+import pytest
+
+from models import Item
+from search import snapshot
+from search.index import InvertedIndex
+from search.snapshot import SnapshotIndex
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_utils import Doc, build_index
+
+
+DOCS = [
+    Doc(1, 'tavolo da cucina', 'legno massello'),
+    Doc(2, 'sedie da cucina', 'set di quattro sedie'),
+    Doc(3, 'divano letto', 'tessuto grigio'),
+    Doc(4, 'Poltrona relax', 'pelle più'),
+]
+
+QUERIES = ['cucina', 'cucna', 'grijo', 'latto', 'divano grigio', 'tavolo sedie',
+           'poltrona', 'più', 'zzz', '']
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('index.snapshot'))
+
+
+class TestSnapshotIndex:
+    @pytest.mark.parametrize('edit_distance', [None, 1, 2])
+    @pytest.mark.parametrize('phonetic', [None, 'metaphone'])
+    def test_load(self, path, phonetic, edit_distance):
+        index = build_index(DOCS, phonetic=phonetic, edit_distance=edit_distance)
+        snapshot.save(index, path, {'version': 3})
+        loaded = snapshot.load(path)
+
+        assert isinstance(loaded, SnapshotIndex)
+        assert loaded.phonetic_algorithm == phonetic
+        assert loaded.edit_distance == edit_distance
+        assert loaded.attributes == ['name', 'description']
+        assert loaded.meta == {'version': 3}
+        assert len(loaded) == 4
+        assert 3 in loaded and 5 not in loaded
+        assert dict(loaded.documents) == index.documents
+        for query in QUERIES:
+            for fuzzy in (True, False):
+                assert loaded.candidates(query, fuzzy) == index.candidates(query, fuzzy)
+
+    def test_load__empty_index(self, path):
+        snapshot.save(build_index([]), path)
+        loaded = snapshot.load(path)
+
+        assert len(loaded) == 0
+        assert loaded.candidates('cucina') == set()
+
+    def test_load__not_a_snapshot(self, path):
+        with open(path, 'wb') as fo:
+            fo.write(b'not a snapshot file')
+
+        with pytest.raises(ValueError):
+            snapshot.load(path)
+
+    def test_save__integer_keys_only(self, path):
+        index = InvertedIndex(['name'], key=lambda obj: str(obj.id)).build(DOCS)
+
+        with pytest.raises(ValueError):
+            snapshot.save(index, path)
+
+    def test_add_remove(self, path):
+        snapshot.save(build_index(DOCS, phonetic='metaphone', edit_distance=1), path)
+        index = snapshot.load(path)
+
+        index.add(Doc(1, 'poltrona', 'pelle'))
+        index.add(Doc(5, 'sedia', 'pelle'))
+        index.remove(2)
+        index.remove(42)
+
+        expected = build_index(DOCS, phonetic='metaphone', edit_distance=1)
+        expected.add(Doc(1, 'poltrona', 'pelle'))
+        expected.add(Doc(5, 'sedia', 'pelle'))
+        expected.remove(2)
+
+        assert len(index) == 4
+        assert 2 not in index and 5 in index
+        assert dict(index.documents) == expected.documents
+        for query in QUERIES + ['pelle', 'sedia', 'sedya', 'pele']:
+            assert index.candidates(query) == expected.candidates(query)
+
+
+class TestItemSearchSnapshot(TestCase):
+    def test_search_index__from_snapshot(self, path, monkeypatch):
+        monkeypatch.setattr(Item, '_search_snapshot', path)
+        item = test_utils.add_item(name='divano', description='', category='')
+        test_utils.add_item(name='letto', description='', category='')
+
+        Item.save_search_snapshot()
+        index = Item.search_index()
+        assert isinstance(index, SnapshotIndex)
+        assert not any(Item.check_search_index().values())
+
+        # changes after loading are tracked by the signals
+        item.name = 'divano letto'
+        item.save()
+        assert index.candidates('divano letto') == {item.id, item.id + 1}
+        result = Item.search('divano', Item.select(), use_index=True)
+        assert [i.name for i in result] == ['divano letto']
+
+    def test_check_search_index__snapshot(self, path):
+        item = test_utils.add_item(name='divano', description='', category='')
+        Item.save_search_snapshot(path)
+        assert not any(Item.check_search_index(snapshot.load(path)).values())
+
+        # the snapshot is loaded as it is, even if the table changed since
+        Item.update(name='poltrona').where(Item.id == item.id).execute()
+        other = test_utils.add_item(name='letto', description='', category='')
+
+        diff = Item.check_search_index(snapshot.load(path))
+        assert diff == {'missing': {other.id}, 'stale': set(), 'outdated': {item.id}}
+
+    def test_search_index__outdated_snapshot(self, path, monkeypatch):
+        monkeypatch.setattr(Item, '_search_snapshot', path)
+        item = test_utils.add_item(name='divano', description='', category='')
+        test_utils.add_item(name='poltrona', description='', category='')
+        Item.save_search_snapshot()
+
+        # the snapshot is opened and refreshed with the changes since saved
+        other = test_utils.add_item(name='letto', description='', category='')
+        item.name = 'divano letto'
+        item.save()
+        Item.delete().where(Item.name == 'poltrona').execute()
+        index = Item.search_index()
+
+        assert isinstance(index, SnapshotIndex)
+        assert len(index) == 2
+        assert index.candidates('letto', fuzzy=False) == {item.id, other.id}
+        assert index.candidates('poltrona', fuzzy=False) == set()
+        assert not any(Item.check_search_index().values())
+
+    def test_search_index__snapshot_other_settings(self, path, monkeypatch):
+        monkeypatch.setattr(Item, '_search_snapshot', path)
+        test_utils.add_item(name='divano', description='', category='')
+        Item.save_search_snapshot()
+
+        monkeypatch.setattr(Item, '_search_edit_distance', None)
+        index = Item.search_index()
+
+        assert isinstance(index, InvertedIndex)
+        assert len(index) == 1
@@ -0,0 +1,90 @@
+"""
+Test suite for the autocomplete trie (:mod:`search.trie`).
+"""
+from collections import Counter
+import random
+
+import pytest
+
+from models import Item
+from tests import test_utils
+from tests.test_case import TestCase
+from tests.test_utils import Doc, build_trie
+
+
+DOCS = [
+    Doc(1, 'scarpe rosse'),
+    Doc(2, 'scarpe blu'),
+    Doc(3, 'scarpette da ballo'),
+    Doc(4, 'scaffale in legno'),
+    Doc(5, 'sedia in legno'),
+]
+
+
+class TestCompletionTrie:
+    def test_complete(self):
+        trie = build_trie(DOCS)
+
+        assert trie.complete('sca') == ['scarpe', 'scaffale', 'scarpette']
+        assert trie.complete('SCAR ') == ['scarpe', 'scarpette']
+        assert trie.complete('scarpe') == ['scarpe', 'scarpette']
+        assert trie.complete('scarpet') == ['scarpette']
+        assert trie.complete('scarpez') == []
+        assert trie.complete('poltrona') == []
+        assert trie.complete('') == [
+            'legno', 'scarpe', 'ballo', 'rosse', 'scaffale', 'scarpette', 'sedia']
+
+    def test_complete__limit(self):
+        trie = build_trie(DOCS, size=2)
+
+        assert trie.complete('s') == ['scarpe', 'scaffale']
+        assert trie.complete('s', 1) == ['scarpe']
+        assert trie.complete('s', 5) == ['scarpe', 'scaffale']
+
+    def test_add_remove(self):
+        trie = build_trie(DOCS)
+        trie.remove(1)
+        trie.remove(2)
+        trie.remove(42)
+
+        assert len(trie) == 3
+        assert trie.complete('scar') == ['scarpette']
+
+        trie.add(Doc(3, 'scarpa rossa'))
+        assert trie.complete('scar') == ['scarpa']
+        assert trie.complete('ballo') == []
+        assert 'r' not in trie.root.children['s'].children
+
+    @pytest.mark.parametrize('size', [1, 3, 10])
+    def test_complete__same_as_brute_force(self, size):
+        rand = random.Random(42)
+        vocabulary = [''.join(rand.choice('abc') for _ in range(rand.randint(4, 7)))
+                      for _ in range(200)]
+        docs = [Doc(i, ' '.join(rand.sample(vocabulary, 3))) for i in range(300)]
+        trie = build_trie(docs, size=size)
+        for doc in rand.sample(docs, 100):
+            trie.remove(doc.id)
+        for doc in rand.sample(docs, 50):
+            trie.add(doc._replace(name=' '.join(rand.sample(vocabulary, 2))))
+
+        counts = Counter(t for tokens in trie.documents.values() for t in tokens)
+        for prefix in ['', 'a', 'ab', 'abc', 'bca', 'cccc', 'aaaaaaaa']:
+            expected = sorted((-n, t) for t, n in counts.items() if t.startswith(prefix))
+            assert trie.complete(prefix) == [t for _, t in expected[:size]]
+
+
+class TestItemSuggest(TestCase):
+    def test_suggest(self):
+        for name in ['scarpe rosse', 'scarpe blu', 'scarpette', 'sedia']:
+            test_utils.add_item(name=name)
+
+        assert Item.suggest('sca') == ['scarpe', 'scarpette']
+
+        item = test_utils.add_item(name='scarponi')
+        assert Item.suggest('scarp', 2) == ['scarpe', 'scarpette']
+        item.name = 'scarpe nere'
+        item.save()
+        assert Item.suggest('scarp') == ['scarpe', 'scarpette']
+        assert Item.suggest('ner') == ['nere']
+        item.delete_instance()
+        assert Item.suggest('ner') == []
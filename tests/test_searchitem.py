@@ -1,6 +1,6 @@
 import json
 
-from models import Item
+from models import Item, User
 import search
 from tests import test_utils
 from tests.test_case import TestCase
@@ -18,6 +18,8 @@ NAMES = [
 
 
 def get_names(objects):
+    if objects and isinstance(objects[0], dict):
+        return [d['data']['attributes']['name'] for d in objects]
     return [r.name for r in objects]
 
 
@@ -42,6 +44,7 @@ class TestSearchItems(TestCase):
     @classmethod
     def teardown_class(cls):
         Item.delete().execute()
+        User.delete().execute()
 
     def search(self, query, attributes=['name', 'description'], limit=10):
         return search.search(query, attributes, Item.select(), limit)
@@ -133,3 +136,189 @@ class TestSearchItems(TestCase):
         }
 
         assert data == expected
+
+    def test_search_rest_empty_query(self):
+        resp = self.app.get('/items/db/?query=&limit=10')
+
+        assert resp.status_code == 200
+        assert json.loads(resp.data) == []
+
+    def test_search_rest_explain(self):
+        test_utils.add_admin_user('explain.admin@email.com', 'p4ssw0rd',
+                                  id='0ad7b1e2-5c3f-4d8a-9b6e-1f2a3c4d5e6f')
+        resp = test_utils.open_with_auth(
+            self.app, '/items/db/?query=divano&limit=10&explain=1', 'GET',
+            'explain.admin@email.com', 'p4ssw0rd', None, None)
+
+        assert resp.status_code == 200
+        result = json.loads(resp.data)
+        names = [d['data']['attributes']['name'] for d in result['data']]
+        assert names == ['divano', 'divano letto']
+
+        explain = result['meta']['explain']
+        assert explain['query'] == ['divano']
+        assert set(explain['timings_ms']) == {
+            'candidates', 'load', 'tokenize', 'scoring', 'sort'}
+        assert [r['id'] for r in explain['results']] == [
+            d['data']['id'] for d in result['data']]
+        assert [r['attribute'] for r in explain['results']] == ['name', 'name']
+
+    def test_search_rest_explain_not_admin(self):
+        test_utils.add_user('explain.user@email.com', 'p4ssw0rd',
+                            id='7c9e6679-7425-40de-944b-e07fc1f90ae7')
+        resp = test_utils.open_with_auth(
+            self.app, '/items/db/?query=divano&limit=10&explain=1', 'GET',
+            'explain.user@email.com', 'p4ssw0rd', None, None)
+        assert resp.status_code == 401
+
+        resp = self.app.get('/items/db/?query=divano&limit=10&explain=1')
+        assert resp.status_code == 401
+
+    def test_search_rest_batch(self):
+        queries = [
+            {'query': 'divano', 'limit': 10},
+            {'query': 'tavolo sedie', 'limit': 3, 'weights': [1, 3, 2]},
+            {'query': 'scarpe', 'limit': 5},
+        ]
+        resp = self.app.post('/items/db/', data=json.dumps({'queries': queries}))
+
+        assert resp.status_code == 200
+        result = json.loads(resp.data)
+        assert len(result) == 3
+        for query, docs in zip(queries, result):
+            expected = Item.search(query['query'], Item.select(), query['limit'],
+                                   weights=query.get('weights'), use_index=True)
+            assert [d['data']['attributes']['name'] for d in docs] == get_names(expected)
+        assert [d['data']['attributes']['name'] for d in result[0]] == [
+            'divano', 'divano letto']
+
+    def test_search_rest_batch_invalid(self):
+        queries = [
+            {'query': 'divano', 'limit': 10},
+            {'limit': 150},
+            {'query': 'tavolo', 'limit': 5, 'weights': 'name'},
+            {'query': 'tavolo', 'limit': 5, 'weights': [0, 0, 0]},
+            {'query': 'tavolo', 'limit': 5, 'weights': [1, -1, 0]},
+            {'query': 'tavolo', 'limit': True, 'weights': [True, 1, 1]},
+            {'query': 'tavolo', 'limit': 5, 'weights': []},
+        ]
+        resp = self.app.post('/items/db/', data=json.dumps({'queries': queries}))
+
+        assert resp.status_code == 400
+        assert json.loads(resp.data) == {
+            "errors": [{
+                "detail": "Query 1: Missing query."
+            }, {
+                "detail": "Query 1: Limit out of range. must be between 0 and 100. "
+                          "Requested: 150"
+            }, {
+                "detail": "Query 2: Weights must be a list of numbers."
+            }, {
+                "detail": "Query 3: Weights must be non-negative with at least one positive."
+            }, {
+                "detail": "Query 4: Weights must be non-negative with at least one positive."
+            }, {
+                "detail": "Query 5: Limit out of range. must be between 0 and 100. "
+                          "Requested: True"
+            }, {
+                "detail": "Query 5: Weights must be a list of numbers."
+            }, {
+                "detail": "Query 6: Weights must be non-negative with at least one positive."
+            }]
+        }
+
+    def test_search_rest_batch_no_queries(self):
+        resp = self.app.post('/items/db/', data=json.dumps({'queries': []}))
+        assert resp.status_code == 400
+        assert json.loads(resp.data) == {"errors": [{"detail": "Missing queries."}]}
+
+        queries = [{'query': 'divano', 'limit': 1}] * 11
+        resp = self.app.post('/items/db/', data=json.dumps({'queries': queries}))
+        assert resp.status_code == 400
+        assert json.loads(resp.data) == {"errors": [{
+            "detail": "Too many queries. must be at most 10. Requested: 11"}]}
+
+    def test_suggest_rest(self):
+        resp = self.app.get('/items/suggest/?prefix=sca')
+
+        assert resp.status_code == 200
+        assert json.loads(resp.data) == {'suggestions': [
+            'scarpe', 'scarpacce', 'scarpette', 'scarpine', 'scarponi']}
+
+        resp = self.app.get('/items/suggest/?prefix=Tav&limit=2')
+        assert json.loads(resp.data) == {'suggestions': ['tavolo', 'tavola']}
+
+    def test_suggest_rest_no_prefix_limit_over(self):
+        resp = self.app.get('/items/suggest/?prefix=%20&limit=11')
+
+        assert resp.status_code == 400
+        assert json.loads(resp.data) == {
+            "errors": [{
+                "detail": "Missing prefix."
+            }, {
+                "detail": "Limit out of range. must be between 0 and 10. Requested: 11"
+            }]
+        }
+
+
+class TestSearchItemsFilters(TestCase):
+    def setup_method(self):
+        super(TestSearchItemsFilters, self).setup_method()
+        for name, category, price in [
+                ('scarpe da ginnastica', 'calzature', 40),
+                ('scarpe da ballo', 'calzature', 90),
+                ('scarpette', 'accessori', 15),
+                ('borsa per scarpe', 'accessori', 25),
+                ('giacca', 'abbigliamento uomo', 120)]:
+            test_utils.add_item(name=name, description='', category=category,
+                                price=price)
+
+    def get(self, url):
+        resp = self.app.get(url)
+        return resp.status_code, json.loads(resp.data)
+
+    def test_search_rest_category_price(self):
+        status, data = self.get('/items/db/?query=scarpe&limit=10&category=calzature')
+        assert status == 200
+        assert sorted(get_names(data)) == ['scarpe da ballo', 'scarpe da ginnastica']
+
+        status, data = self.get(
+            '/items/db/?query=scarpe&limit=10&category=calzature&category=accessori'
+            '&min_price=20&max_price=50')
+        assert status == 200
+        assert sorted(get_names(data)) == ['borsa per scarpe', 'scarpe da ginnastica']
+
+    def test_search_rest_facets(self):
+        status, data = self.get(
+            '/items/db/?query=scarpe&limit=10&category=calzature&max_price=100'
+            '&facets=category')
+
+        assert status == 200
+        assert sorted(get_names(data['data'])) == [
+            'scarpe da ballo', 'scarpe da ginnastica']
+        # facets count the candidates of any category
+        assert data['meta'] == {'facets': {'category': {'calzature': 2, 'accessori': 2}}}
+
+    def test_search_rest_filters_invalid(self):
+        status, data = self.get(
+            '/items/db/?query=scarpe&limit=10&min_price=abc&max_price=-1&facets=name')
+
+        assert status == 400
+        assert data == {"errors": [
+            {"detail": "min_price must be a non negative number. Requested: abc"},
+            {"detail": "max_price must be a non negative number. Requested: -1"},
+            {"detail": "Facets must be one of category. Requested: name"},
+        ]}
+
+    def test_search_faceted(self):
+        dataset = Item.select().where(Item.price <= 100)
+        Item.search_index()
+        with test_utils.capture_queries() as queries:
+            results, counts = Item.search_faceted(
+                'scarpe', dataset, 'category', ['accessori'], use_index=True)
+
+        assert [r.name for r in results] == ['scarpette', 'borsa per scarpe']
+        assert counts == {'calzature': 2, 'accessori': 2}
+        # the candidates are loaded in a single query
+        assert len(queries) == 1
+        assert 'GROUP BY' not in queries[0]
@@ -2,10 +2,13 @@
 Utilities toolkit for testing the application with pytest.
 
 """
+from collections import namedtuple
+from contextlib import contextmanager
 from functools import reduce
 import datetime
 import inspect
 import json
+import logging
 import os
 import random
 import shutil
@@ -14,6 +17,8 @@ import uuid
 from base64 import b64encode
 
 from models import Address, User, Favorite, Item
+from search.index import InvertedIndex
+from search.trie import CompletionTrie
 from utils import get_image_folder
 
 
@@ -199,6 +204,29 @@ def count_order_items(order):
         tot += oi.quantity
     return tot
 
+
+@contextmanager
+def capture_queries():
+    """
+    Capture the SQL statements executed inside the ``with`` block, as logged
+    by peewee. Yields the list the statements are appended to.
+    """
+    queries = []
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            queries.append(record.msg[0])
+
+    logger = logging.getLogger('peewee')
+    handler, level = Handler(), logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    try:
+        yield queries
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+
 # ###########################################################
 # JSONAPI testing utilities
 
@@ -313,3 +341,42 @@ def wrong_dump(data):
     """
     return reduce(lambda x, y: "{}&{}".format(x, y), [
         "{}={}".format(k, v) for k, v in zip(data.keys(), data.values())])
+
+
+# ###########################################################
+# Search engine helpers
+# Plain documents to index and search without the database
+
+
+#: Document with the attributes searched by the search engine tests, all of
+#: them but the ``id`` and ``name`` are optional.
+Doc = namedtuple('Doc', ['id', 'name', 'description', 'category', 'updated_at'])
+Doc.__new__.__defaults__ = ('', '', None)
+
+WORDS = ['tavolo', 'tavola', 'sedie', 'sedia', 'letto', 'divano', 'scarpe',
+         'legno', 'cucina', 'poltrona', 'set', 'con', 'di']
+
+ATTRIBUTES = ['name', 'category', 'description']
+
+
+def random_phrase(length):
+    """Return a phrase of ``length`` random :any:`WORDS`."""
+    return ' '.join(random.choice(WORDS) for _ in range(length))
+
+
+def random_docs(num_docs, seed=42):
+    """Return ``num_docs`` documents of random :any:`WORDS`."""
+    random.seed(seed)
+    return [Doc(i, random_phrase(random.randint(1, 3)),
+                category=random.choice(WORDS), description=random_phrase(5))
+            for i in range(num_docs)]
+
+
+def build_index(docs, attributes=('name', 'description'), **kwargs):
+    """Return an :class:`InvertedIndex` of the ``docs`` attributes."""
+    return InvertedIndex(list(attributes), **kwargs).build(docs)
+
+
+def build_trie(docs, attributes=('name',), size=None):
+    """Return a :class:`CompletionTrie` of the ``docs`` attributes."""
+    return CompletionTrie(list(attributes), size=size).build(docs)
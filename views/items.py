@@ -4,17 +4,26 @@ with items resources
 """
 
 import http.client as client
+import json
 import uuid
 
 from flask import request
 from flask_restful import Resource
 
+from auth import auth
 from models import Item
+from search import Explanation, config as search_config
 from utils import generate_response
 
 
 SEARCH_FIELDS = ['name', 'description']
 
+#: max number of queries of a batch search request
+MAX_BATCH_QUERIES = 10
+
+#: fields whose candidates can be counted by the search (``facets`` argument)
+FACET_FIELDS = ['category']
+
 
 class ItemsHandler(Resource):
     """Handler of the collection of items"""
@@ -116,23 +125,183 @@ class ItemHandler(Resource):
 
 class SearchItemHandler(Resource):
     def get(self):
+        """
+        Search the items matching the ``query`` argument, at most ``limit``.
+
+        The items can be restricted to one or more exact ``category`` values
+        and to a ``min_price`` and ``max_price`` before being scored.
+        ``facets=category`` adds the number of candidates of each category
+        (within the price range, any category) and admins can pass
+        ``explain=1`` to get the timings of the search and the breakdown of
+        the match of each result. With any of the two the response has the
+        results list as ``data`` and the facets and explanation as ``meta``.
+        """
         query = request.args.get('query')
         limit = int(request.args.get('limit', -1))
+        categories = request.args.getlist('category')
+        facets = request.args.get('facets')
+        explain = request.args.get('explain') == '1'
         min_limit, max_limit = 0, 100
 
-        limit_in_range = limit > min_limit and limit <= max_limit
+        if explain and not getattr(auth.current_user, 'admin', False):
+            return ({'message': "You can't explain the search."}, client.UNAUTHORIZED)
+
+        def fmt_error(msg):
+            return {'detail': msg}
+
+        errors = {"errors": []}
+
+        if not (limit > min_limit and limit <= max_limit):
+            msg = 'Limit out of range. must be between {} and {}. Requested: {}'
+            errors['errors'].append(
+                fmt_error(msg.format(min_limit, max_limit, limit)))
+
+        prices = {}
+        for arg in ('min_price', 'max_price'):
+            value = request.args.get(arg)
+            if value is None:
+                continue
+            try:
+                prices[arg] = float(value)
+            except ValueError:
+                prices[arg] = -1
+            if prices[arg] < 0:
+                msg = '{} must be a non negative number. Requested: {}'
+                errors['errors'].append(fmt_error(msg.format(arg, value)))
+
+        if facets is not None and facets not in FACET_FIELDS:
+            msg = 'Facets must be one of {}. Requested: {}'
+            errors['errors'].append(
+                fmt_error(msg.format(', '.join(FACET_FIELDS), facets)))
+
+        # an empty query is valid (it matches no item), it is reported as
+        # missing only along with other errors.
+        if query is None or (not query and errors['errors']):
+            errors['errors'].insert(0, fmt_error('Missing query.'))
+
+        if errors['errors']:
+            return errors, client.BAD_REQUEST
 
-        if query is not None and limit_in_range:
-            matches = Item.search(query, Item.select(), limit)
+        # exact filters are applied by the database, before the fuzzy scoring
+        dataset = Item.select()
+        if 'min_price' in prices:
+            dataset = dataset.where(Item.price >= prices['min_price'])
+        if 'max_price' in prices:
+            dataset = dataset.where(Item.price <= prices['max_price'])
+        facet_dataset = dataset
+        if categories:
+            dataset = dataset.where(Item.category << categories)
+
+        if not (facets or explain):
+            matches = Item.search(query, dataset, limit, use_index=True,
+                                  use_cache=True)
             return generate_response(Item.json_list(matches), client.OK)
 
+        meta = {}
+        explanation = Explanation() if explain else None
+        if facets:
+            # the candidates of any category are loaded once, counted and
+            # only the ones of the requested categories are scored.
+            matches, counts = Item.search_faceted(
+                query, facet_dataset, facets, categories or None, limit,
+                use_index=True, explain=explanation)
+            meta['facets'] = {facets: counts}
+        else:
+            matches = Item.search(query, dataset, limit, use_index=True,
+                                  explain=explanation)
+
+        if explain:
+            meta['explain'] = explanation.json()
+            for result, item in zip(meta['explain']['results'], matches):
+                result['id'] = str(item.uuid)
+
+        data = {'data': json.loads(Item.json_list(matches)), 'meta': meta}
+        return generate_response(json.dumps(data), client.OK)
+
+    def post(self):
+        """
+        Run several searches in a single pass over the items. The request body
+        is a ``{"queries": [{"query": ..., "limit": ..., "weights": ...}]}``
+        object, where ``weights`` is optional, and the response is a list with
+        the JSONAPI list of results of each query.
+        """
+        request_data = request.get_json(force=True) or {}
+        queries = request_data.get('queries')
+        min_limit, max_limit = 0, 100
+
+        def fmt_error(msg):
+            return {'detail': msg}
+
+        errors = {"errors": []}
+
+        if not isinstance(queries, list) or not queries:
+            errors['errors'].append(fmt_error('Missing queries.'))
+            return errors, client.BAD_REQUEST
+
+        if len(queries) > MAX_BATCH_QUERIES:
+            msg = 'Too many queries. must be at most {}. Requested: {}'
+            errors['errors'].append(
+                fmt_error(msg.format(MAX_BATCH_QUERIES, len(queries))))
+            return errors, client.BAD_REQUEST
+
+        for i, spec in enumerate(queries):
+            spec = spec if isinstance(spec, dict) else {}
+            limit = spec.get('limit', -1)
+            weights = spec.get('weights')
+
+            if not spec.get('query') or not isinstance(spec['query'], str):
+                errors['errors'].append(fmt_error('Query {}: Missing query.'.format(i)))
+
+            if (not isinstance(limit, int) or isinstance(limit, bool) or
+                    not min_limit < limit <= max_limit):
+                msg = 'Query {}: Limit out of range. must be between {} and {}. Requested: {}'
+                errors['errors'].append(
+                    fmt_error(msg.format(i, min_limit, max_limit, limit)))
+
+            if weights is not None and (
+                    not isinstance(weights, list) or
+                    not all(isinstance(w, (int, float)) and not isinstance(w, bool)
+                            for w in weights)):
+                msg = 'Query {}: Weights must be a list of numbers.'
+                errors['errors'].append(fmt_error(msg.format(i)))
+            elif weights is not None and (
+                    any(w < 0 for w in weights) or not any(w > 0 for w in weights)):
+                msg = 'Query {}: Weights must be non-negative with at least one positive.'
+                errors['errors'].append(fmt_error(msg.format(i)))
+
+        if errors['errors']:
+            return errors, client.BAD_REQUEST
+
+        queries = [{'query': q['query'], 'limit': q['limit'], 'weights': q.get('weights')}
+                   for q in queries]
+        results = Item.search_many(queries, Item.select(), use_index=True)
+        data = '[{}]'.format(','.join(Item.json_list(r) for r in results))
+        return generate_response(data, client.OK)
+
+
+class SuggestItemHandler(Resource):
+    def get(self):
+        """
+        Autocomplete the ``prefix`` argument with the most popular tokens of
+        the items names, at most ``limit`` (default and max
+        :any:`config.SUGGEST_SIZE`).
+        """
+        prefix = request.args.get('prefix', '').strip()
+        limit = int(request.args.get('limit', search_config.SUGGEST_SIZE))
+        min_limit, max_limit = 0, search_config.SUGGEST_SIZE
+
+        limit_in_range = limit > min_limit and limit <= max_limit
+
+        if prefix and limit_in_range:
+            return {'suggestions': Item.suggest(prefix, limit)}, client.OK
+
         def fmt_error(msg):
             return {'detail': msg}
 
         errors = {"errors": []}
 
-        if not query:
-            errors['errors'].append(fmt_error('Missing query.'))
+        if not prefix:
+            errors['errors'].append(fmt_error('Missing prefix.'))
 
         if not limit_in_range:
             msg = 'Limit out of range. must be between {} and {}. Requested: {}'
@@ -21,7 +21,7 @@ class OrdersHandler(Resource):
 
     def get(self):
         """ Get all the orders."""
-        data = Order.json_list(Order.select())
+        data = Order.json_list(Order.with_items())
         return generate_response(data, OK)
 
     @auth.login_required
@@ -54,8 +54,9 @@ class OrdersHandler(Resource):
 
         # Check that the items exist
         item_ids = [req_item['id'] for req_item in req_items]
-        items = Item.select().where(Item.uuid << item_ids)
-        if items.count() != len(req_items):
+        items = {str(item.uuid): item
+                 for item in Item.select().where(Item.uuid << item_ids)}
+        if len(items) != len(req_items):
             abort(BAD_REQUEST)
 
         # Check that the address exist
@@ -65,24 +66,11 @@ class OrdersHandler(Resource):
             abort(BAD_REQUEST)
 
         # Generate the dict of {<Item>: <int:quantity>} to call Order.create_order
-        items_to_add = {}
-        for req_item in req_items:
-            item = next(i for i in items if str(i.uuid) == req_item['id'])
-            items_to_add[item] = req_item['quantity']
+        items_to_add = {items[req_item['id']]: req_item['quantity']
+                        for req_item in req_items}
         with database.atomic():
             try:
-                order = Order.create(
-                    delivery_address=address,
-                    user=auth.current_user,
-                )
-
-                for item in items:
-                    for req_item in req_items:
-                        # if names match add item and quantity, once per
-                        # req_item
-                        if str(item.uuid) == req_item['id']:
-                            order.add_item(item, req_item['quantity'])
-                            break
+                order = Order.create_order(auth.current_user, address, items_to_add)
                 notify_new_order(address=order.delivery_address, user=order.user)
             except InsufficientAvailabilityException:
                 abort(BAD_REQUEST)
@@ -95,10 +83,10 @@ class OrderHandler(Resource):
 
     def get(self, order_uuid):
         """ Get a specific order, including all the related Item(s)."""
-        try:
-            order = Order.get(Order.uuid == order_uuid)
-        except Order.DoesNotExist:
+        orders = list(Order.with_items(Order.select().where(Order.uuid == order_uuid)))
+        if not orders:
             return None, NOT_FOUND
+        order = orders[0]
 
         return generate_response(order.json(), OK)
 